@@ -0,0 +1,187 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## asyncio runtime
+##
+###########
+"""Run the clock core on one asyncio loop
+
+Ticks, button debounce, the blank timeout and the web
+status are all driven from a single event loop. The pigpio
+library talks to pigpiod over a blocking socket, so every
+call that touches the board (timer callbacks and state
+machine handlers) is handed to one dedicated hardware
+thread. The loop itself never waits on the socket, and
+board I/O stays serialized exactly as it is in the threaded
+runtime.
+
+Classes:
+
+    AsyncRuntime
+    AsyncScheduler
+
+Functions:
+
+    run(retro)
+
+Misc variables:
+
+    status
+"""
+
+import asyncio
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import monotonic_ns
+
+from clock import SYSTEM
+from scheduler import Job
+
+class AsyncScheduler:
+    """scheduler.Scheduler work-alike on an asyncio loop
+    """
+
+    VERSION = '0.0.1'
+
+    # the loop runs on the system clock
+    clock = SYSTEM
+
+    _loop = None
+    _hardware = None
+
+    def _call(self, job):
+        try:
+            job._f(*job._args)
+        except Exception:
+            traceback.print_exc()
+
+    def _fire(self, job):
+        if job.cancelled:
+            return
+
+        if job.interval:
+            now = monotonic_ns()
+            job.deadline += job.interval
+            if job.deadline <= now:
+                missed = (now - job.deadline) // job.interval + 1
+                job.deadline += missed * job.interval
+            self._arm(job)
+        else:
+            job.cancelled = True
+
+        self._hardware.submit(self._call, job)
+
+    def _arm(self, job):
+        # the default loop clock is time.monotonic()
+        self._loop.call_at(job.deadline / 1e9, self._fire, job)
+
+    def _schedule(self, delay, interval, f, args):
+        job = Job(self, monotonic_ns() + int(delay * 1e9), interval, f, args)
+        self._loop.call_soon_threadsafe(self._arm, job)
+
+        return job
+
+    def every(self, interval, f, *args):
+        """call f(*args) every interval seconds
+        """
+
+        return self._schedule(interval, int(interval * 1e9), f, args)
+
+    def after(self, delay, f, *args):
+        """call f(*args) once, delay seconds from now
+        """
+
+        return self._schedule(delay, None, f, args)
+
+    def cancel(self, job):
+        """cancel a job
+        """
+
+        job.cancelled = True
+
+    def stop(self):
+        """nothing to stop, the jobs die with the loop
+        """
+
+    def __init__(self, loop, hardware):
+        self._loop = loop
+        self._hardware = hardware
+
+class AsyncRuntime:
+    """the asyncio runtime
+    """
+
+    VERSION = '0.0.1'
+
+    # seconds
+    _STATUS_INTERVAL = 1
+
+    loop = None
+    scheduler = None
+    status = None
+
+    _hardware = None
+    _ready = None
+
+    async def _events(self, retro):
+        """dispatch queued events to the display state machine
+        """
+
+        event = retro.event
+        display = retro.display
+        while True:
+            ev = event.poll()
+            if ev is None:
+                self._ready.clear()
+                ev = event.poll()
+                if ev is None:
+                    await self._ready.wait()
+                    continue
+
+            await self.loop.run_in_executor(self._hardware, display.state_machine, ev)
+
+    async def _status(self, retro):
+        """refresh the web status once a second
+        """
+
+        while True:
+            display_time = await self.loop.run_in_executor(self._hardware,
+                                                           retro.display.time)
+            self.status = {
+                'version': retro.version(),
+                'up_time': retro.up_since.strftime('%m/%d/%Y %H:%M:%S'),
+                'display_time': display_time.strftime('%m/%d/%Y %H:%M:%S'),
+                'system_time': datetime.now().strftime('%m/%d/%Y %H:%M:%S'),
+            }
+            await asyncio.sleep(self._STATUS_INTERVAL)
+
+    async def _main(self, retro):
+        self._ready = asyncio.Event()
+        retro.event.listen(lambda: self.loop.call_soon_threadsafe(self._ready.set))
+
+        await asyncio.gather(self._events(retro), self._status(retro))
+
+    def run(self, retro):
+        """run the clock until the loop is stopped
+        """
+
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._main(retro))
+
+    def __init__(self):
+        """create the loop, its hardware thread and scheduler
+        """
+
+        self.loop = asyncio.new_event_loop()
+        self._hardware = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pigpio')
+        self.scheduler = AsyncScheduler(self.loop, self._hardware)
+        self.status = {}
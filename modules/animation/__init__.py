@@ -0,0 +1,298 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## frame animations
+##
+###########
+"""Compile and play frame sequences
+
+See module encoder for frame packing.
+
+An animation is compiled up front into a Sequence, packed
+8 byte SPI frames and how long each is held, so playing it
+costs nothing but the writes.
+
+The Player streams sequences from its own thread, writing
+each frame against an absolute deadline, and reports the
+frame rate achieved and how late frames started. Playback
+is timed by the host: pigpiod won't run SPI writes from a
+script, so the daemon can't play frames itself. On a
+virtual clock, see module clock, nothing moves time but
+the caller, so play() writes the sequence out itself.
+
+Classes:
+
+    Compiler
+    Player
+    Sequence
+
+Functions:
+
+    add(frame, hold)
+    busy()
+    crossfade(from_, to, seconds, period)
+    duration()
+    play(sequence, done)
+    report()
+    slot_machine(from_, to, spin, step, stagger)
+    stop()
+    sweep(cycles, hold)
+
+Misc variables:
+
+    frames
+    holds
+"""
+
+import queue
+import traceback
+
+from array import array
+from threading import Event, Lock, Thread
+
+from clock import SYSTEM
+from latency import Histogram
+
+class Sequence:
+    """packed frames and their hold times
+    """
+
+    VERSION = '0.0.1'
+
+    # 8 bytes per frame
+    frames = None
+
+    # microseconds per frame
+    holds = None
+
+    def add(self, frame, hold):
+        """append a frame, hold in seconds
+        """
+
+        hold = round(hold * 1e6)
+        if hold <= 0:
+            return
+
+        self.frames += frame
+        self.holds.append(hold)
+
+    def frame(self, n):
+        """the nth frame
+        """
+
+        return self.frames[n * 8:n * 8 + 8]
+
+    def duration(self):
+        """seconds
+        """
+
+        return sum(self.holds) / 1e6
+
+    def __len__(self):
+        return len(self.holds)
+
+    def __init__(self):
+        self.frames = bytearray()
+        self.holds = array('I')
+
+class Compiler:
+    """animations to sequences
+    """
+
+    VERSION = '0.0.1'
+
+    _encoder = None
+
+    def _frame(self, digits):
+        return bytes(self._encoder.encode(digits))
+
+    def sweep(self, cycles=10, hold=0.01):
+        """cathode cleaning, every tube through every digit
+        """
+
+        sequence = Sequence()
+        for _ in range(cycles):
+            for digit in range(10):
+                sequence.add(self._frame([digit for _ in range(8)]), hold)
+
+        return sequence
+
+    def slot_machine(self, from_, to, spin=0.4, step=0.03, stagger=0.1):
+        """spin the tubes that change, stopping them left to right on to
+        """
+
+        changed = [tube for tube in range(len(to)) if from_[tube] != to[tube]]
+        stops = {tube: spin + rank * stagger for rank, tube in enumerate(changed)}
+
+        sequence = Sequence()
+        steps = round((spin + stagger * max(len(changed) - 1, 0)) / step)
+        for n in range(1, steps + 1):
+            digits = list(to)
+            for tube in changed:
+                if n * step < stops[tube]:
+                    start = from_[tube] if from_[tube] < 10 else 0
+                    digits[tube] = (start + n) % 10
+            sequence.add(self._frame(digits), step)
+
+        sequence.add(self._frame(to), step)
+
+        return sequence
+
+    def crossfade(self, from_, to, seconds=0.3, period=0.01):
+        """fade the changing digits by multiplexing the two frames,
+           each period shows a little more of to
+        """
+
+        old, new = self._frame(from_), self._frame(to)
+
+        sequence = Sequence()
+        periods = max(1, round(seconds / period))
+        for n in range(periods):
+            fraction = (n + 1) / periods
+            sequence.add(old, period * (1 - fraction))
+            sequence.add(new, period * fraction)
+
+        return sequence
+
+    def __init__(self, encoder):
+        """encoder: packs the frames for the board
+        """
+
+        self._encoder = encoder
+
+class Player:
+    """stream sequences to the tubes
+    """
+
+    VERSION = '0.0.1'
+
+    # seconds, the last stretch before a deadline is spun
+    _SPIN = 0.001
+
+    _ncs31x = None
+    _clock = None
+
+    _queue = None
+
+    # sequences queued or playing
+    _busy = None
+    _busy_lock = None
+    _stop = None
+    _thread = None
+
+    _frames = None
+    _elapsed = None
+    _late = None
+
+    def _wait(self, deadline):
+        """sleep, then spin, until the clock reads deadline
+        """
+
+        delay = (deadline - self._clock.monotonic_ns()) / 1e9 - self._SPIN
+        if self._clock.virtual:
+            self._clock.sleep(delay + self._SPIN)
+            return
+
+        if delay > 0:
+            self._clock.sleep(delay)
+        while self._clock.monotonic_ns() < deadline:
+            pass
+
+    def _stream(self, sequence):
+        """play a sequence from this thread
+        """
+
+        deadline = self._clock.monotonic_ns()
+        for n in range(len(sequence)):
+            if self._stop.is_set():
+                return
+
+            self._wait(deadline)
+            self._late.record(self._clock.monotonic_ns() - deadline, self._clock.monotonic_ns())
+            self._ncs31x.latch_frame(sequence.frame(n))
+            deadline += sequence.holds[n] * 1000
+
+        self._wait(deadline)
+
+    def _play(self, sequence, done):
+        self._stop.clear()
+        start = self._clock.monotonic_ns()
+        try:
+            self._stream(sequence)
+        except Exception:
+            traceback.print_exc()
+
+        self._frames += len(sequence)
+        self._elapsed += self._clock.monotonic_ns() - start
+        with self._busy_lock:
+            self._busy -= 1
+
+        if done is not None:
+            done()
+
+    def _run(self):
+        while True:
+            self._play(*self._queue.get())
+
+    def play(self, sequence, done=None):
+        """queue a sequence, call done() when it has played
+        """
+
+        with self._busy_lock:
+            self._busy += 1
+        if self._clock.virtual:
+            self._play(sequence, done)
+        else:
+            self._queue.put((sequence, done))
+
+    def busy(self):
+        """is a sequence queued or playing
+        """
+
+        return self._busy > 0
+
+    def stop(self):
+        """cut the playing sequence short
+        """
+
+        self._stop.set()
+
+    def report(self):
+        """frames played, frames per second achieved, and frame
+           start lateness in nanoseconds
+        """
+
+        return {
+            'frames': self._frames,
+            'fps': self._frames / (self._elapsed / 1e9) if self._elapsed else None,
+            'late': self._late.report(),
+        }
+
+    def __init__(self, ncs31x, window=60, clock=SYSTEM):
+        """ncs31x: the board
+           window: seconds per rolling lateness window
+           clock: times the frames, see module clock
+        """
+
+        self._ncs31x = ncs31x
+        self._clock = clock
+
+        self._queue = queue.Queue()
+        self._busy = 0
+        self._busy_lock = Lock()
+        self._stop = Event()
+
+        self._frames = 0
+        self._elapsed = 0
+        self._late = Histogram(window)
+
+        if not clock.virtual:
+            self._thread = Thread(target=self._run, name='player', daemon=True)
+            self._thread.start()
@@ -0,0 +1,137 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## static assets
+##
+###########
+"""Serve static assets from memory
+
+The static tree is read once at startup. Every file gets
+a strong ETag and, where it helps, gzip and brotli variants
+compressed up front, so serving an asset is a dictionary
+lookup: no disk I/O and no compression per request.
+
+brotli is optional, without it only gzip is offered.
+
+Classes:
+
+    Assets
+
+Functions:
+
+    add(path, body, mimetype)
+    body(path)
+    serve(path, if_none_match, accept_encoding)
+
+Misc variables:
+
+    _assets
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+class Assets:
+    """the assets class
+    """
+
+    VERSION = '0.0.1'
+
+    # seconds
+    _MAX_AGE = 7 * 24 * 60 * 60
+
+    # not worth compressing
+    _COMPRESSED = ('image/', 'video/', 'audio/', 'font/woff')
+
+    _assets = None
+
+    def add(self, path, body, mimetype=None):
+        """add an asset, path is relative to the static root
+        """
+
+        if mimetype is None:
+            mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+        tag = hashlib.sha256(body).hexdigest()[:20]
+
+        variants = {}
+        if not mimetype.startswith(self._COMPRESSED):
+            variants['gzip'] = gzip.compress(body, 9, mtime=0)
+            if brotli is not None:
+                variants['br'] = brotli.compress(body)
+
+        self._assets[path] = {
+            'mimetype': mimetype,
+            'body': body,
+            'etag': '"{}"'.format(tag),
+            'variants': {encoding: (variant, '"{}-{}"'.format(tag, encoding))
+                         for encoding, variant in variants.items()
+                         if len(variant) < len(body)},
+        }
+
+    def body(self, path):
+        """the uncompressed body of an asset
+        """
+
+        return self._assets[path]['body']
+
+    def serve(self, path, if_none_match=None, accept_encoding=''):
+        """answer a request for an asset
+
+            return (status, headers, body), or None if there is no such asset
+        """
+
+        asset = self._assets.get(path)
+        if asset is None:
+            return None
+
+        body, etag, encoding = asset['body'], asset['etag'], None
+        accepted = [token.split(';')[0].strip() for token in accept_encoding.split(',')]
+        for encoding_ in ('br', 'gzip'):
+            if encoding_ in accepted and encoding_ in asset['variants']:
+                body, etag = asset['variants'][encoding_]
+                encoding = encoding_
+                break
+
+        headers = {
+            'ETag': etag,
+            'Cache-Control': 'public, max-age={}'.format(self._MAX_AGE),
+            'Vary': 'Accept-Encoding',
+        }
+
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            if '*' in tags or etag in tags:
+                return 304, headers, b''
+
+        headers['Content-Type'] = asset['mimetype']
+        headers['Content-Length'] = str(len(body))
+        if encoding:
+            headers['Content-Encoding'] = encoding
+
+        return 200, headers, body
+
+    def __init__(self, root):
+        """load every file under root
+        """
+
+        self._assets = {}
+        for dir_, _, files in os.walk(root):
+            for file in files:
+                path = os.path.join(dir_, file)
+                with open(path, 'rb') as f:
+                    self.add(os.path.relpath(path, root).replace(os.sep, '/'), f.read())
@@ -0,0 +1,286 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## backlight effects
+##
+###########
+"""Timed backlight effects
+
+See module ncs31x for the backlight PWM.
+
+Colors are red, green, blue duty cycles, 0 to 100, as in
+etc/retro.json. Effects move through perceptual brightness,
+not duty cycle, so a fade looks even to the eye: duty cycles
+are mapped through precomputed gamma tables, interpolated,
+and mapped back.
+
+An effect is compiled into a list of steps and stored in
+pigpiod as a script, the daemon times the steps and we only
+start and stop it. Where the daemon won't take the script,
+a scheduler job walks the steps instead. Effects are timed
+on the scheduler's clock.
+
+Classes:
+
+    Backlight
+
+Functions:
+
+    breathe(color, period, floor)
+    color()
+    cycle(colors, period)
+    fade(color, seconds)
+    set(color)
+    stop()
+
+Misc variables:
+
+    _gamma_table
+    _perceptual
+"""
+
+import atexit
+import pigpio
+
+from threading import Lock
+
+from ncs31x import Ncs31x
+
+class Backlight:
+    """the backlight effects class
+    """
+
+    VERSION = '0.0.1'
+
+    _GAMMA = 2.2
+    _LEVELS = 256
+
+    # seconds per step, steps per effect
+    _STEP = 0.02
+    _MAX_STEPS = 250
+
+    _PINS = (Ncs31x.RED_LIGHT_PIN, Ncs31x.GREEN_LIGHT_PIN, Ncs31x.BLUE_LIGHT_PIN)
+
+    _ncs31x = None
+    _gpio = None
+    _scheduler = None
+    _lock = None
+
+    # the running effect, steps are (color, seconds)
+    _steps = None
+    _loop = None
+    _start = None
+    _script = None
+    _job = None
+    _color = None
+
+    # perceptual level: duty cycle, and back
+    _gamma_table = None
+    _perceptual = None
+
+    def _blend(self, from_, to, fraction):
+        """a color fraction of the way from from_ to to
+        """
+
+        return tuple(self._gamma_table[round(self._perceptual[a]
+                                             + (self._perceptual[b] - self._perceptual[a]) * fraction)]
+                     for a, b in zip(from_, to))
+
+    def _ramp(self, from_, to, seconds):
+        """steps from from_ to to over seconds
+        """
+
+        n = max(1, min(self._MAX_STEPS, round(seconds / self._STEP)))
+        return [(self._blend(from_, to, (step + 1) / n), seconds / n) for step in range(n)]
+
+    def _merge(self, steps):
+        """fold steps that don't change the color into their predecessor
+        """
+
+        merged = []
+        for color, seconds in steps:
+            if merged and merged[-1][0] == color:
+                merged[-1] = (color, merged[-1][1] + seconds)
+            else:
+                merged.append((color, seconds))
+
+        return merged
+
+    def _compile(self, steps, loop):
+        """script text for steps
+        """
+
+        text = ['tag 0'] if loop else []
+        last = (None, None, None)
+        for color, seconds in steps:
+            for pin, duty, was in zip(self._PINS, color, last):
+                if duty != was:
+                    text.append('pwm {} {}'.format(pin, duty))
+            last = color
+            text.append('mils {}'.format(max(1, round(seconds * 1000))))
+
+        if loop:
+            text.append('jmp 0')
+
+        return ' '.join(text)
+
+    def _stop(self):
+        """stop the running effect, leaving the color where it got to
+        """
+
+        if self._steps is not None:
+            self._color = self._position()
+            self._steps = None
+
+        if self._script is not None:
+            try:
+                self._gpio.stop_script(self._script)
+                self._gpio.delete_script(self._script)
+            except pigpio.error:
+                pass
+            self._script = None
+
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+
+    def _position(self):
+        """the color the running effect has reached
+        """
+
+        elapsed = self._scheduler.clock.monotonic() - self._start
+        total = sum(seconds for _, seconds in self._steps)
+        if self._loop:
+            elapsed %= total
+
+        for color, seconds in self._steps:
+            elapsed -= seconds
+            if elapsed < 0:
+                return color
+
+        return self._steps[-1][0]
+
+    def _walk(self):
+        """scheduler fallback, one step per _STEP
+        """
+
+        with self._lock:
+            if self._steps is None:
+                return
+
+            color = self._position()
+            if color != self._color:
+                self._color = color
+                self._ncs31x.backlight(color)
+
+            elapsed = self._scheduler.clock.monotonic() - self._start
+            if not self._loop and elapsed >= sum(s for _, s in self._steps):
+                self._job.cancel()
+                self._job = None
+                self._steps = None
+
+    def _play(self, steps, loop):
+        """start an effect
+        """
+
+        self._stop()
+
+        steps = self._merge(steps)
+        self._steps = steps
+        self._loop = loop
+        self._start = self._scheduler.clock.monotonic()
+
+        self._script = self._ncs31x.store_script(self._compile(steps, loop))
+        if self._script is not None:
+            try:
+                self._gpio.run_script(self._script)
+                return
+            except pigpio.error:
+                self._gpio.delete_script(self._script)
+                self._script = None
+
+        self._job = self._scheduler.every(self._STEP, self._walk)
+
+    def color(self):
+        """the current color
+        """
+
+        with self._lock:
+            return self._position() if self._steps is not None else self._color
+
+    def set(self, color):
+        """snap to a color
+        """
+
+        with self._lock:
+            self._stop()
+            self._color = tuple(color)
+            self._ncs31x.backlight(self._color)
+
+    def fade(self, color, seconds):
+        """fade from the current color to color
+        """
+
+        if not seconds:
+            self.set(color)
+            return
+
+        with self._lock:
+            self._stop()
+            self._play(self._ramp(self._color, tuple(color), seconds), False)
+
+    def breathe(self, color, period, floor=0.1):
+        """swell and ebb color forever, floor is the fraction of
+           perceptual brightness at the bottom
+        """
+
+        with self._lock:
+            low = self._blend((0, 0, 0), tuple(color), floor)
+            self._play(self._ramp(low, tuple(color), period / 2)
+                       + self._ramp(tuple(color), low, period / 2), True)
+
+    def cycle(self, colors, period):
+        """fade around colors forever, period seconds per color
+        """
+
+        with self._lock:
+            colors = [tuple(color) for color in colors]
+            steps = []
+            for n, color in enumerate(colors):
+                steps += self._ramp(color, colors[(n + 1) % len(colors)], period)
+            self._play(steps, True)
+
+    def stop(self):
+        """stop any effect where it is
+        """
+
+        with self._lock:
+            self._stop()
+
+    def __init__(self, ncs31x, scheduler):
+        """effects on the ncs31x backlight
+
+            scheduler: runs the steps when the daemon can't
+        """
+
+        self._ncs31x = ncs31x
+        self._gpio = ncs31x._gpio
+        self._scheduler = scheduler
+        self._lock = Lock()
+        self._color = (0, 0, 0)
+
+        top = self._LEVELS - 1
+        self._gamma_table = tuple(round(Ncs31x._MAX_POWER * (level / top) ** self._GAMMA)
+                                  for level in range(self._LEVELS))
+        self._perceptual = tuple(round(top * (duty / Ncs31x._MAX_POWER) ** (1 / self._GAMMA))
+                                 for duty in range(Ncs31x._MAX_POWER + 1))
+
+        # a script left running outlives us in the daemon
+        atexit.register(self.stop)
@@ -0,0 +1,160 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## status broadcaster
+##
+###########
+"""Fan the clock status out to web clients
+
+One scheduler job computes the status once per interval,
+no matter how many browsers are watching, and queues only
+the fields that changed to every subscriber. Subscribers
+get the full status when they join. A subscriber that
+falls a whole queue behind is dropped.
+
+stream() turns a subscription into server-sent events for
+any WSGI framework.
+
+Classes:
+
+    Broadcaster
+
+Functions:
+
+    publish()
+    stop()
+    stream()
+    subscribe()
+    subscribers()
+    unsubscribe(subscriber)
+
+Misc variables:
+
+    _last
+    _subscribers
+"""
+
+import json
+import queue
+import traceback
+
+from threading import Lock
+
+class Broadcaster:
+    """the broadcaster class
+    """
+
+    VERSION = '0.0.1'
+
+    # seconds
+    _KEEPALIVE = 15
+
+    _QUEUE_DEPTH = 16
+
+    _source = None
+    _job = None
+
+    _lock = None
+    _last = None
+    _subscribers = None
+
+    def publish(self):
+        """compute the status and queue what changed
+        """
+
+        try:
+            status = self._source()
+        except Exception:
+            traceback.print_exc()
+            return
+
+        with self._lock:
+            delta = {key: val for key, val in status.items() if self._last.get(key) != val}
+            if not delta:
+                return
+
+            self._last = dict(status)
+            for subscriber in list(self._subscribers):
+                try:
+                    subscriber.put_nowait(delta)
+                except queue.Full:
+                    self._subscribers.remove(subscriber)
+
+    def subscribe(self):
+        """join the broadcast
+
+            return a queue of status deltas, primed with the full status
+        """
+
+        subscriber = queue.Queue(self._QUEUE_DEPTH)
+        with self._lock:
+            if self._last:
+                subscriber.put_nowait(dict(self._last))
+            self._subscribers.append(subscriber)
+
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """leave the broadcast
+        """
+
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def subscribers(self):
+        """number of connected clients
+        """
+
+        with self._lock:
+            return len(self._subscribers)
+
+    def stream(self):
+        """server-sent event stream for one client
+
+            the subscription is dropped when the server closes the
+            generator after the client goes away
+        """
+
+        subscriber = self.subscribe()
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    delta = subscriber.get(timeout=self._KEEPALIVE)
+                except queue.Empty:
+                    with self._lock:
+                        if subscriber not in self._subscribers:
+                            return
+                    yield ': keepalive\n\n'
+                    continue
+
+                yield 'data: {}\n\n'.format(json.dumps(delta))
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stop(self):
+        """stop publishing
+        """
+
+        self._job.cancel()
+
+    def __init__(self, scheduler, source, interval=1):
+        """broadcast source() every interval seconds
+
+            source: returns a dict of status fields
+        """
+
+        self._source = source
+        self._lock = Lock()
+        self._last = {}
+        self._subscribers = []
+
+        self._job = scheduler.every(interval, self.publish)
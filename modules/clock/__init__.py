@@ -0,0 +1,112 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## time sources
+##
+###########
+"""Injectable time sources
+
+The scheduler, the display, the board and the pigpiod
+stand-in take their time from a clock rather than from
+module time, so a simulation can run them on virtual time.
+
+The scheduler carries the clock, see module scheduler, and
+the modules that schedule take it from there, so everything
+sharing a scheduler shares a time source.
+
+Clock is the system clock. A VirtualClock only moves when
+it is told to: the simulation advances it from one timer
+deadline to the next, and sleeping advances it by the time
+slept, so a sleep costs nothing and nothing else can run
+meanwhile. It is meant to be driven from one thread.
+
+Classes:
+
+    Clock
+    VirtualClock
+
+Functions:
+
+    advance(seconds)
+    advance_to(ns)
+    monotonic()
+    monotonic_ns()
+    sleep(seconds)
+    time()
+
+Misc variables:
+
+    SYSTEM
+    virtual
+"""
+
+import time as time_
+
+class Clock:
+    """the system clock
+    """
+
+    VERSION = '0.0.1'
+
+    # does time only move when told to
+    virtual = False
+
+    # the time functions themselves, so a call costs no more
+    # than calling module time
+    time = staticmethod(time_.time)
+    monotonic_ns = staticmethod(time_.monotonic_ns)
+    monotonic = staticmethod(time_.monotonic)
+    sleep = staticmethod(time_.sleep)
+
+SYSTEM = Clock()
+
+class VirtualClock(Clock):
+    """simulated time
+    """
+
+    VERSION = '0.0.1'
+
+    virtual = True
+
+    _epoch = None
+    _ns = None
+
+    def time(self):
+        return self._epoch + self._ns / 1e9
+
+    def monotonic_ns(self):
+        return self._ns
+
+    def monotonic(self):
+        return self._ns / 1e9
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        """move time on by seconds
+        """
+
+        if seconds > 0:
+            self._ns += int(seconds * 1e9)
+
+    def advance_to(self, ns):
+        """move time on to monotonic_ns() ns, time never goes back
+        """
+
+        if ns > self._ns:
+            self._ns = ns
+
+    def __init__(self, start=None):
+        """start: epoch seconds at monotonic 0, default now
+        """
+
+        self._epoch = time_.time() if start is None else start
+        self._ns = 0
@@ -0,0 +1,274 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## configuration
+##
+###########
+"""Compiled configuration with hot reload
+
+etc/retro.json is compiled once into a Config, a slotted
+object with the derived fields precomputed, so the display
+path reads an attribute instead of looking up and comparing
+strings every tick.
+
+The Config is updated in place on reload, everyone holding
+it sees the new values, and reload() reports which fields
+changed so only those are applied.
+
+A Watcher follows the file with inotify, or by polling its
+mtime where inotify is not available.
+
+Classes:
+
+    Config
+    Watcher
+
+Functions:
+
+    compile(conf_dict)
+    reload()
+    update(config)
+
+Misc variables:
+
+    _DEFAULTS
+    _KEYS
+    RESTART
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import struct
+import traceback
+
+from threading import Thread
+from time import sleep
+
+class Config:
+    """compiled configuration
+    """
+
+    VERSION = '0.0.1'
+
+    # retro.json key: field
+    _KEYS = {
+        'time-format': 'time_format',
+        'date-format': 'date_format',
+        'zero-blank': 'zero_blank',
+        'back-light': 'back_light',
+        'back-light-fade': 'back_light_fade',
+        'blank-timeout': 'blank_timeout',
+        'dots': 'dots',
+        'minute-animation': 'minute_animation',
+        'button-glitch': 'button_glitch',
+        'button-long-press': 'button_long_press',
+        'button-repeat': 'button_repeat',
+        'ntp': 'ntp',
+        'ntp-tolerance': 'ntp_tolerance',
+        'rtc-resync': 'rtc_resync',
+        'rtc-discipline': 'rtc_discipline',
+        'rtc-threshold': 'rtc_threshold',
+        'rtc-aging': 'rtc_aging',
+        'runtime': 'runtime',
+        'http-host': 'http_host',
+        'http-port': 'http_port',
+        'http-workers': 'http_workers',
+        'http-keep-alive': 'http_keep_alive',
+        'http-log': 'http_log',
+        'control-socket': 'control_socket',
+        'trace-size': 'trace_size',
+        'trace-file': 'trace_file',
+    }
+
+    # retro.json key: value if the file doesn't have it, so a
+    # file written for an earlier version still loads
+    _DEFAULTS = {
+        'time-format': '12hour',
+        'date-format': 'US',
+        'zero-blank': False,
+        'back-light': [100, 20, 0],
+        'back-light-fade': 0.5,
+        'blank-timeout': 60,
+        'dots': True,
+        'minute-animation': 'none',
+        'button-glitch': 5000,
+        'button-long-press': 1.0,
+        'button-repeat': 0.15,
+        'ntp': True,
+        'ntp-tolerance': 1,
+        'rtc-resync': 300,
+        'rtc-discipline': 600,
+        'rtc-threshold': 0.05,
+        'rtc-aging': False,
+        'runtime': 'threads',
+        'http-host': 'retro',
+        'http-port': 8080,
+        'http-workers': 16,
+        'http-keep-alive': 5,
+        'http-log': False,
+        'control-socket': '/tmp/retro.sock',
+        'trace-size': 4096,
+        'trace-file': '/tmp/retro.trace',
+    }
+
+    # fields only read at startup
+    RESTART = ('button_glitch', 'ntp', 'ntp_tolerance', 'rtc_resync',
+               'rtc_discipline', 'rtc_threshold', 'rtc_aging', 'runtime',
+               'http_host', 'http_port', 'http_workers', 'http_keep_alive', 'http_log',
+               'control_socket', 'trace_size')
+
+    __slots__ = tuple(_KEYS.values()) + ('hour12', 'path')
+
+    def compile(self, conf_dict):
+        """set the fields from a retro.json dictionary, missing
+           keys take their defaults
+        """
+
+        for key, field in self._KEYS.items():
+            if key in conf_dict:
+                setattr(self, field, conf_dict[key])
+            else:
+                print('config: no {}, using {}'.format(key, json.dumps(self._DEFAULTS[key])))
+                setattr(self, field, self._DEFAULTS[key])
+
+        self.hour12 = self.time_format == '12hour'
+        self.back_light = tuple(int(duty) for duty in self.back_light)
+
+    def update(self, config):
+        """take the fields of another config
+
+            return the names of the fields that changed
+        """
+
+        changed = set()
+        for field in self._KEYS.values():
+            if getattr(self, field) != getattr(config, field):
+                setattr(self, field, getattr(config, field))
+                changed.add(field)
+
+        self.hour12 = config.hour12
+
+        return changed
+
+    def reload(self):
+        """reread the file
+
+            return the names of the fields that changed, a file
+            that does not parse changes nothing
+        """
+
+        try:
+            config = Config(self.path)
+        except Exception:
+            traceback.print_exc()
+            return set()
+
+        return self.update(config)
+
+    def __init__(self, path):
+        """compile the configuration file at path
+        """
+
+        self.path = path
+        with open(path, 'r') as file:
+            self.compile(json.load(file))
+
+class Watcher:
+    """call back when a file is rewritten
+    """
+
+    VERSION = '0.0.1'
+
+    # seconds
+    _POLL = 2
+
+    _IN_CLOSE_WRITE = 0x00000008
+    _IN_MOVED_TO = 0x00000080
+    _IN_CLOEXEC = 0o2000000
+
+    _EVENT = struct.Struct('iIII')
+
+    _path = None
+    _callback = None
+    _thread = None
+
+    def _inotify(self):
+        """watch the directory, editors often replace the file
+           rather than rewrite it
+
+            return the inotify descriptor, or None
+        """
+
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(self._IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+
+        if fd < 0:
+            return None
+
+        dir_ = os.path.dirname(os.path.abspath(self._path)).encode()
+        if libc.inotify_add_watch(fd, dir_, self._IN_CLOSE_WRITE | self._IN_MOVED_TO) < 0:
+            os.close(fd)
+            return None
+
+        return fd
+
+    def _watch(self, fd):
+        name = os.path.basename(self._path).encode()
+        while True:
+            buf = os.read(fd, 4096)
+            offset = 0
+            changed = False
+            while offset < len(buf):
+                _, _, _, len_ = self._EVENT.unpack_from(buf, offset)
+                offset += self._EVENT.size
+                if buf[offset:offset + len_].rstrip(b'\0') == name:
+                    changed = True
+                offset += len_
+
+            if changed:
+                self._call()
+
+    def _poll(self):
+        mtime = None
+        while True:
+            try:
+                mtime_ = os.stat(self._path).st_mtime_ns
+            except OSError:
+                mtime_ = None
+
+            if mtime is not None and mtime_ is not None and mtime_ != mtime:
+                self._call()
+            mtime = mtime_ or mtime
+            sleep(self._POLL)
+
+    def _call(self):
+        try:
+            self._callback()
+        except Exception:
+            traceback.print_exc()
+
+    def __init__(self, path, callback):
+        """call callback() from a daemon thread whenever path changes
+        """
+
+        self._path = path
+        self._callback = callback
+
+        fd = self._inotify()
+        if fd is None:
+            self._thread = Thread(target=self._poll, name='watcher', daemon=True)
+        else:
+            self._thread = Thread(target=self._watch, args=(fd,), name='watcher', daemon=True)
+        self._thread.start()
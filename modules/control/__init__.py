@@ -0,0 +1,172 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## control socket
+##
+###########
+"""Control the running clock over a Unix domain socket
+
+The protocol is a line per command, answered by a line of
+json, {"ok": true, ...} or {"ok": false, "error": ...}:
+
+    blank
+    unblank
+    clean
+    set-backlight red green blue
+    status
+
+blank, unblank and clean go through the display's event
+queue like button presses do, so they never fight the live
+display state.
+
+The socket is removed at exit.
+
+Classes:
+
+    ControlServer
+
+Functions:
+
+    command(line)
+    request(path, command)
+    stop()
+
+Misc variables:
+
+    COMMANDS
+"""
+
+import atexit
+import json
+import os
+import socket
+import socketserver
+import traceback
+
+from threading import Thread
+
+VERSION = '0.0.1'
+
+# seconds
+_TIMEOUT = 2
+
+def request(path, command):
+    """send a command to the clock at path
+
+        return the decoded reply, raise OSError if no clock is listening
+    """
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(_TIMEOUT)
+        sock.connect(path)
+        sock.sendall(command.encode() + b'\n')
+        with sock.makefile('rb') as file:
+            return json.loads(file.readline())
+
+class ControlServer:
+    """the control socket server
+    """
+
+    VERSION = '0.0.1'
+
+    COMMANDS = ('blank', 'unblank', 'clean', 'set-backlight', 'status')
+
+    _retro = None
+    _path = None
+    _server = None
+    _thread = None
+
+    def _blank(self):
+        self._retro.display.blank_display()
+
+    def _unblank(self):
+        self._retro.display.unblank_display()
+
+    def _clean(self):
+        self._retro.display.clean_display()
+
+    def _set_backlight(self, red, green, blue):
+        color = [int(red), int(green), int(blue)]
+        if not all(0 <= duty <= 100 for duty in color):
+            raise ValueError('duty cycles are 0 to 100')
+
+        self._retro.gra_afch._backlight.fade(color, self._retro.config.back_light_fade)
+
+    def _status(self):
+        display = self._retro.display
+        discipline = self._retro.discipline
+        return dict(self._retro.status(),
+                    state=display.STATES[display._state],
+                    events=self._retro.event.stats(),
+                    rtc=discipline.report() if discipline else None)
+
+    def command(self, line):
+        """run one command line, return the reply
+        """
+
+        words = line.split()
+        if not words or words[0] not in self.COMMANDS:
+            return {'ok': False, 'error': 'unknown command: {}'.format(line.strip())}
+
+        try:
+            result = getattr(self, '_' + words[0].replace('-', '_'))(*words[1:])
+        except TypeError:
+            return {'ok': False, 'error': 'wrong number of arguments: {}'.format(line.strip())}
+        except ValueError as ex:
+            return {'ok': False, 'error': str(ex)}
+
+        reply = {'ok': True}
+        if result:
+            reply.update(result)
+
+        return reply
+
+    def stop(self):
+        """stop serving and remove the socket
+        """
+
+        atexit.unregister(self.stop)
+        self._server.shutdown()
+        self._server.server_close()
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+    def __init__(self, retro, path):
+        """serve retro's control socket at path
+        """
+
+        self._retro = retro
+        self._path = path
+
+        # a socket left behind by a clock that died
+        if os.path.exists(path):
+            os.unlink(path)
+
+        control = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        reply = control.command(line.decode())
+                    except Exception:
+                        traceback.print_exc()
+                        reply = {'ok': False, 'error': 'internal error'}
+                    self.wfile.write(json.dumps(reply).encode() + b'\n')
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        self._server = Server(path, Handler)
+        os.chmod(path, 0o660)
+
+        self._thread = Thread(target=self._server.serve_forever, name='control', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
@@ -0,0 +1,279 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## RTC discipline
+##
+###########
+"""Keep the NCS31X RTC on the system clock
+
+See module ncs31x for the RTC interface, module shadow_clock
+for the display's view of it.
+
+The DS3231 only reads out whole seconds, so the offset from
+the system clock is sampled at a seconds edge: poll the RTC
+until the seconds roll over and take the system time there.
+After the first sample we know roughly when the next edge
+is due, so the polling only starts just before it.
+
+The samples are fitted by least squares, giving the offset
+now and the drift rate. The RTC is only written when the
+fitted offset passes the threshold, and the write lands on
+a system second boundary, since the DS3231 restarts its
+seconds countdown when the seconds register is written.
+A write steps the samples by the offset it took out, so
+the fit keeps its history across corrections, and rebases
+the shadow clock on the second written. With aging
+on, once the fit spans long enough the drift is trimmed
+out in the DS3231 aging register so the corrections get
+rarer still.
+
+Classes:
+
+    Discipline
+
+Functions:
+
+    report()
+    sample()
+    start()
+    stop()
+
+Misc variables:
+
+    _samples
+"""
+
+import pigpio
+import traceback
+
+from threading import Event, Thread
+from time import localtime, mktime, monotonic, sleep, time
+
+class Discipline:
+    """the RTC discipline loop
+    """
+
+    VERSION = '0.0.1'
+
+    # seconds, edge polling and how early to start before a predicted edge
+    _EDGE_POLL = 0.001
+    _EDGE_EARLY = 0.02
+    _EDGE_TIMEOUT = 1.1
+
+    # samples kept for the fit
+    _SAMPLES = 64
+
+    # the fit has to span this many seconds and samples before trimming aging
+    _AGING_SPAN = 6 * 3600
+    _AGING_SAMPLES = 8
+    _AGING_PPM = 0.1
+
+    _ncs31x = None
+    _clock = None
+    _interval = None
+    _threshold = None
+    _aging = None
+
+    _thread = None
+    _stop = None
+
+    # (system time, RTC - system seconds) since the last correction
+    _samples = None
+    _offset = None
+    _drift = None
+    _round_trip = None
+
+    _writes = None
+    _trims = None
+
+    def _read(self):
+        """read the RTC in epoch seconds
+
+            return (seconds, system time the read was sampled)
+        """
+
+        start = time()
+        seconds = mktime(self._ncs31x.read_rtc(False))
+        end = time()
+
+        self._round_trip = end - start
+        return seconds, (start + end) / 2
+
+    def _edge(self):
+        """wait for the RTC seconds to roll over
+
+            return (RTC seconds at the edge, system time of the edge),
+            or None if the RTC never ticked
+        """
+
+        if self._offset is not None:
+            now = time()
+            due = int(now + self._offset) + 1 - self._offset
+            if due - now > self._EDGE_EARLY:
+                sleep(due - now - self._EDGE_EARLY)
+
+        last, at = self._read()
+        deadline = monotonic() + self._EDGE_TIMEOUT
+        while monotonic() < deadline:
+            sleep(self._EDGE_POLL)
+            seconds, now = self._read()
+            if seconds != last:
+                return seconds, (at + now) / 2
+            at = now
+
+        return None
+
+    def _fit(self):
+        """least squares over the samples
+
+            return (offset now, drift in ppm), drift is None
+            with fewer than two samples
+        """
+
+        if len(self._samples) < 2:
+            return self._samples[-1][1], None
+
+        t0 = self._samples[0][0]
+        n = len(self._samples)
+        mean_t = sum(t - t0 for t, _ in self._samples) / n
+        mean_o = sum(o for _, o in self._samples) / n
+        var = sum((t - t0 - mean_t) ** 2 for t, _ in self._samples)
+        if not var:
+            return mean_o, None
+
+        slope = sum((t - t0 - mean_t) * (o - mean_o) for t, o in self._samples) / var
+
+        return mean_o + slope * (time() - t0 - mean_t), slope * 1e6
+
+    def _correct(self, offset):
+        """write the RTC on the next system second boundary, taking
+           offset out of it
+
+            the samples are stepped by the same amount, so the
+            drift fit carries on across the write, and the shadow
+            clock is based on the write rather than left to find
+            the next edge
+        """
+
+        second = int(time()) + 1
+        delay = second - time() - self._round_trip / 2
+        if delay > 0:
+            sleep(delay)
+
+        self._ncs31x.write_rtc(localtime(second))
+
+        # the write landed on second, half a round trip ago
+        self._clock.rebase(second + self._round_trip / 2)
+
+        self._writes += 1
+        self._samples = [(at, old - offset) for at, old in self._samples]
+        self._offset = None
+
+    def _trim(self):
+        """take the fitted drift out of the oscillator
+        """
+
+        span = self._samples[-1][0] - self._samples[0][0]
+        if span < self._AGING_SPAN or len(self._samples) < self._AGING_SAMPLES:
+            return
+
+        steps = round(self._drift / self._AGING_PPM)
+        if not steps:
+            return
+
+        aging = self._ncs31x.aging()
+        trimmed = min(max(aging + steps, -128), 127)
+        if trimmed == aging:
+            return
+
+        self._ncs31x.write_aging(trimmed)
+
+        # the old samples are at the old rate
+        self._trims += 1
+        self._samples = self._samples[-1:]
+
+    def sample(self):
+        """take one sample and correct the RTC if it needs it
+
+            return the fitted offset in seconds before any
+            correction, None if the RTC isn't ticking
+        """
+
+        edge = self._edge()
+        if edge is None:
+            return None
+
+        seconds, at = edge
+        self._samples = (self._samples + [(at, seconds - at)])[-self._SAMPLES:]
+        offset, drift = self._fit()
+        self._offset = offset
+        if drift is not None:
+            self._drift = drift
+
+        if abs(offset) > self._threshold:
+            self._correct(offset)
+        elif self._aging and self._drift is not None:
+            self._trim()
+
+        return offset
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except (pigpio.error, OSError):
+                traceback.print_exc()
+            self._stop.wait(self._interval)
+
+    def start(self):
+        """sample every interval seconds from a thread of our own,
+           an edge can take a second to find
+        """
+
+        self._thread = Thread(target=self._run, name='discipline', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """stop sampling
+        """
+
+        self._stop.set()
+
+    def report(self):
+        """fitted offset in seconds, drift in ppm, RTC writes and aging trims
+        """
+
+        return {
+            'offset': self._offset,
+            'drift': self._drift,
+            'samples': len(self._samples),
+            'writes': self._writes,
+            'trims': self._trims,
+        }
+
+    def __init__(self, ncs31x, clock, interval, threshold, aging=False):
+        """ncs31x: the board
+           clock: the shadow clock, invalidated when the RTC is written
+           interval: seconds between samples
+           threshold: offset in seconds that gets the RTC written
+           aging: trim the DS3231 aging register
+        """
+
+        self._ncs31x = ncs31x
+        self._clock = clock
+        self._interval = interval
+        self._threshold = threshold
+        self._aging = aging
+
+        self._stop = Event()
+        self._samples = []
+        self._round_trip = 0.0
+        self._writes = 0
+        self._trims = 0
@@ -19,20 +19,24 @@ See module gra_afch for display board functions.
 Classes:
 
     Display
-    RepeatTimer(Timer)
 
 Functions:
 
     blank_display(self)
+    clean_display(self)
+    configure(changed)
     date_display(self)
     event_loop()
+    latency()
     state_machine(event)
+    trace()
     unblank_display(self)
     version()
 
 Misc variables:
 
-    _conf_dict
+    _config
+    _scheduler
     _sec_timer
     _blank_timer
 
@@ -44,33 +48,15 @@ import pigpio
 import os
 
 from datetime import datetime
-from time import localtime, strftime, mktime
-from threading import Timer
+from threading import Lock
+from time import localtime, strftime, mktime, monotonic_ns
 
 from event import Event
 from gra_afch import GraAfch
+from latency import Latency
 from ncs31x import Ncs31x
+from tracer import Trace
 
-class RepeatTimer(Timer):
-    def __init__(self, interval, f, *args, **kwargs):
-        self.interval = interval
-        self.f = f
-        self.args = args
-        self.kwargs = kwargs
-
-        self.timer = None
-
-    def callback(self):
-        self.f(*self.args, **self.kwargs)
-        self.start()
-
-    def cancel(self):
-        self.timer.cancel()
-
-    def start(self):
-        self.timer = Timer(self.interval, self.callback)
-        self.timer.start()
-        
 class Display:
     """display utilities
     """
@@ -79,71 +65,178 @@ class Display:
     
     _gra_afch = None
     _event = None
-    _conf_dict = None
+    _config = None
 
+    _scheduler = None
     _sec_timer = None
     _blank_timer = None
     
     _is_blank = None
 
+    # fields changed since the last configure event
+    _changed = None
+    _changed_lock = None
+
     _tick_event = None
     _blank_event = None
     _unblank_event = None
+    _configure_event = None
+    _clean_event = None
+    _done_event = None
 
+    STATES = ('blank', 'date', 'time', 'clean')
+
+    # events stamped at the button edge, see module latency
+    INPUTS = ('up-button', 'down-button', 'mode-button', 'up-long', 'down-long', 'mode-long')
+
+    # compiled transitions
     _state = None
-    _state_machine = None
+    _n_events = None
+    _actions = None
+    _next_state = None
+
+    _latency = None
+    _trace = None
+
+    # the scheduler's clock, see module clock
+    _clock = None
 
     def clean_display(self):
-        display = [0 for _ in range(8)]
-        
+        """run the cathode cleaning sweep, without waiting for it
+        """
+
+        self._event.send(self._clean_event)
+
+    def _clean(self):
         self._gra_afch._ncs31x.unblank()
-        self._gra_afch._ncs31x.backlight([0, 0, 0])
-
-        for _ in range(10):
-            for ch in range(10):
-                for tube in range(8):
-                    display[tube] = ch
-                self._gra_afch.display_numerals(display)
-                time.sleep(0.01)
-                self._gra_afch._ncs31x.clear()
-                
+        self._gra_afch._backlight.set([0, 0, 0])
+        self._gra_afch.play(self._gra_afch._compiler.sweep(),
+                            lambda: self._event.send(self._done_event))
+
+    def _cleaned(self):
+        self._gra_afch.clear()
+        if self._is_blank:
+            self._event.send(self._blank_event)
+        else:
+            self._gra_afch._backlight.fade(self._config.back_light, self._config.back_light_fade)
+
     def blank_display(self):
         self._event.send(self._blank_event)
 
     def unblank_display(self):
         self._event.send(self._unblank_event)
 
+    def configure(self, changed):
+        """apply changed config fields from the event loop
+        """
+
+        with self._changed_lock:
+            self._changed |= changed
+        self._event.send(self._configure_event)
+
+    def _configure(self):
+        with self._changed_lock:
+            changed, self._changed = self._changed, set()
+
+        if 'back_light' in changed and not self._is_blank:
+            self._gra_afch._backlight.fade(self._config.back_light, self._config.back_light_fade)
+
+        if 'blank_timeout' in changed:
+            if self._blank_timer:
+                self._blank_timer.cancel()
+                self._blank_timer = None
+            self._blank_timeout()
+
+        if 'dots' in changed:
+            self._gra_afch.dots(self._config.dots)
+
+        restart = sorted(changed.intersection(self._config.RESTART))
+        if restart:
+            print('restart to apply: {}'.format(', '.join(restart)))
+
+    def _blank_timeout(self):
+        if self._config.blank_timeout:
+            self._blank_timer = self._scheduler.every(self._config.blank_timeout,
+                                                      self._event.send, self._blank_event)
+
     def _blank(self):
+        # an animation would go on latching into the blanked tubes
+        self._gra_afch._player.stop()
         self._is_blank = True
         self._gra_afch._ncs31x.blank()
-        self._gra_afch._ncs31x.backlight([0, 0, 0])
+        self._gra_afch._backlight.fade([0, 0, 0], self._config.back_light_fade)
 
     def _unblank(self):
         self._is_blank = False
         self._gra_afch._ncs31x.unblank()
-        self._gra_afch._ncs31x.backlight(self._conf_dict["back-light"])
+        self._gra_afch._backlight.fade(self._config.back_light, self._config.back_light_fade)
+
+        # show the time now rather than at the next second
+        self._event.send(self._tick_event)
 
     def _date(self):
         self._gra_afch._ncs31x.blank()
-        time.sleep(.25)
+        self._clock.sleep(.25)
         self._gra_afch._ncs31x.unblank()
         for _ in range(5):
-            time.sleep(1)
+            self._clock.sleep(1)
             self._gra_afch.date()
-        self._gra_afch._ncs31x.clear()
+        self._gra_afch.clear()
         if self._is_blank:
             self._gra_afch._ncs31x.blank()
 
     def time(self):
-        return datetime.fromtimestamp(mktime(self._gra_afch._ncs31x.read_rtc(False)))
+        return datetime.fromtimestamp(self._gra_afch._clock.now())
+
+    def latency(self):
+        """queue dwell, handler time, tick phase error and press
+           to display, see module latency, and how animations
+           played, see module animation
+        """
+
+        report = self._latency.report()
+        report['player'] = self._gra_afch._player.report()
+
+        return report
+
+    def trace(self):
+        """the recent events as a binary dump, see module tracer
+        """
+
+        return self._trace.dumps(self._gra_afch._clock.now())
 
     # simple state machine
     def state_machine(self, event):
-        key = list(event.keys())[0]
-        # print(self._state, end=" ")
-        # print(event)
-        self._state_machine[self._state][key][0](self)
-        self._state = self._state_machine[self._state][key][1]
+        dequeued = monotonic_ns()
+        state = self._state
+        index = state * self._n_events + event.type
+        action = self._actions[index]
+        if action is not None:
+            action()
+        self._state = self._next_state[index]
+        done = monotonic_ns()
+        self._latency.event(event, state, dequeued, done)
+        self._trace.record(self._clock.monotonic_ns(), event.type, state, self._state,
+                           event.arg, self._gra_afch._frame)
+
+    def _compile(self, transitions):
+        """flatten the transition table into arrays indexed by
+           state * number of event types + event type
+
+           pairs missing from the table are no-ops that stay put
+        """
+
+        self._n_events = len(self._event._names)
+        self._actions = [None for _ in range(len(self.STATES) * self._n_events)]
+        self._next_state = [state
+                            for state in range(len(self.STATES))
+                            for _ in range(self._n_events)]
+
+        for state, table in transitions.items():
+            for name, (action, next_) in table.items():
+                index = self.STATES.index(state) * self._n_events + self._event.type(name)
+                self._actions[index] = action
+                self._next_state[index] = self.STATES.index(next_)
 
     # main event loop
     def event_loop(self):
@@ -151,56 +244,80 @@ class Display:
             event = self._event.wait()
             self.state_machine(event)
 
-    def __init__(self, gra_afch, event):
+    def __init__(self, gra_afch, event, scheduler):
         """initialize the display module
         """
-        self._conf_dict = gra_afch._conf_dict;
-        
+        self._config = gra_afch._config
+
         self._event = event
         self._gra_afch = gra_afch
+        self._scheduler = scheduler
+        self._clock = scheduler.clock
+
+        self._latency = Latency(event._names, self.STATES, inputs=self.INPUTS)
+        self._trace = Trace(event._names, self.STATES, gra_afch._ncs31x._hv5222,
+                            self._config.trace_size, self._clock)
 
-        self._state = 'time'
-        self._state_machine = {
-            'blank': dict([
-                ( 'tick',        [ lambda self: None, 'blank' ] ),
-                ( 'blank',       [ lambda self: None, 'blank' ] ),
-                ( 'unblank',     [ lambda self: Display._unblank(self), 'time' ] ),
-                ( 'up-button',   [ lambda self: Display._unblank(self), 'time' ] ),
-                ( 'down-button', [ lambda self: Display._unblank(self), 'time' ] ),
-                ( 'mode-button', [ lambda self: Display._unblank(self), 'time' ] ),
-            ]),
-            'date': dict([
-                ( 'tick',        [ lambda self: Display._date(self), 'date' ] ),
-                ( 'blank',       [ lambda self: Display._blank(self), 'date' ] ),
-                ( 'unblank',     [ lambda self: Display._unblank(self), 'date' ] ),
-                ( 'up-button',   [ lambda self: None, 'time' ] ),
-                ( 'down-button', [ lambda self: None, 'time' ] ),
-                ( 'mode-button', [ lambda self: None, 'time' ] ),
-            ]),
-            'time': dict([
-                ( 'tick',        [ lambda self: GraAfch.time(self._gra_afch), 'time' ] ),
-                ( 'blank',       [ lambda self: Display._blank(self), 'blank' ] ),
-                ( 'unblank',     [ lambda self: Display._unblank(self), 'time' ] ),
-                ( 'up-button',   [ lambda self: None, 'time' ] ),
-                ( 'down-button', [ lambda self: None, 'time' ] ),
-                ( 'mode-button', [ lambda self: Display._date(self), 'date' ] ),
-            ]),
-        }
-
-        if self._conf_dict['ntp']:
-            gra_afch._ncs31x.write_rtc(datetime.now().timetuple())
+        # the board comes up blanked
+        self._is_blank = True
+        self._changed = set()
+        self._changed_lock = Lock()
+
+        self._state = self.STATES.index('time')
+        self._compile({
+            'blank': {
+                'tick':        ( None, 'blank' ),
+                'blank':       ( None, 'blank' ),
+                'unblank':     ( self._unblank, 'time' ),
+                'up-button':   ( self._unblank, 'time' ),
+                'down-button': ( self._unblank, 'time' ),
+                'mode-button': ( self._unblank, 'time' ),
+                'configure':   ( self._configure, 'blank' ),
+                'clean':       ( self._clean, 'clean' ),
+            },
+            'date': {
+                'tick':        ( self._date, 'date' ),
+                'blank':       ( self._blank, 'date' ),
+                'unblank':     ( self._unblank, 'date' ),
+                'up-button':   ( None, 'time' ),
+                'down-button': ( None, 'time' ),
+                'mode-button': ( None, 'time' ),
+                'configure':   ( self._configure, 'date' ),
+                'clean':       ( self._clean, 'clean' ),
+            },
+            'time': {
+                'tick':        ( gra_afch.time, 'time' ),
+                'blank':       ( self._blank, 'blank' ),
+                'unblank':     ( self._unblank, 'time' ),
+                'up-button':   ( None, 'time' ),
+                'down-button': ( None, 'time' ),
+                'mode-button': ( self._date, 'date' ),
+                'configure':   ( self._configure, 'time' ),
+                'clean':       ( self._clean, 'clean' ),
+            },
+            'clean': {
+                'configure':   ( self._configure, 'clean' ),
+                'done':        ( self._cleaned, 'time' ),
+            },
+        })
+
+        if self._config.ntp:
+            # the RTC restarts its second when it is written, so
+            # it reads tm from the write on
+            tm = localtime(self._clock.time())
+            if gra_afch._ncs31x.write_rtc(tm, self._config.ntp_tolerance):
+                gra_afch._clock.rebase(mktime(tm))
 
         self._tick_event = event.event('tick', None)
         self._blank_event = event.event('blank', None)
         self._unblank_event = event.event('unblank', None)
-                    
+        self._configure_event = event.event('configure', None)
+        self._clean_event = event.event('clean', None)
+        self._done_event = event.event('done', None)
+
         # seconds timer
-        self._sec_timer = RepeatTimer(1, lambda: event.send(self._tick_event))
-        self._sec_timer.start()
+        self._sec_timer = scheduler.every(1, event.send, self._tick_event)
 
         # display timeout
-        if self._conf_dict['blank-timeout']:
-            tm = self._conf_dict['blank-timeout']
-            self._blank_timer = RepeatTimer(tm, lambda: event.send(self._blank_event))
-            self._blank_timer.start()
+        self._blank_timeout()
 
@@ -0,0 +1,134 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## frame encoder
+##
+###########
+"""Encode tube digits into NCS31X SPI frames
+
+See module ncs31x for the frame layout.
+
+Every tube digit, the dots and the tube mask are
+precomputed as 64 bit contributions to the frame,
+already packed for the board's HV5122 or HV5222
+drivers, so encoding a frame is six table lookups,
+a handful of ors and one pack into a reused buffer.
+
+Classes:
+
+    Encoder
+
+Functions:
+
+    dots(on)
+    encode(digits)
+
+Misc variables:
+
+    _frame
+    _tables
+"""
+
+from struct import pack_into
+
+from ncs31x import Ncs31x
+
+class Encoder:
+    """frame encoder
+    """
+
+    VERSION = '0.0.1'
+
+    # one cathode bit per digit, 0x20 blanks the tube
+    _CATHODES = [1 << n for n in range(10)] + [0 for _ in range(10, 0x21)]
+
+    _DIGITS = 6
+    _BITS_PER_TUBE = 10
+
+    _hv5222 = None
+
+    _tables = None
+    _mask = None
+    _dots_bits = None
+    _dots = None
+
+    _frame = None
+
+    def _pack(self, nval):
+        """position a 64 bit frame value for the board's drivers
+        """
+
+        if not self._hv5222:
+            return nval
+
+        bytes_ = nval.to_bytes(8, 'big')
+
+        return int.from_bytes(
+            bytes(Ncs31x._REVERSE_BITS[bytes_[(n + 4) % 8]] for n in range(8)),
+            'big')
+
+    def _shift(self, slot):
+        """bit offset of a digit slot in the 64 bit frame
+        """
+
+        if slot > Ncs31x._RIGHT_REPR_START:
+            base = Ncs31x._LEFT_REPR_START - 2
+            return 32 + (slot - base) * self._BITS_PER_TUBE
+
+        base = Ncs31x._RIGHT_REPR_START - 2
+        return (slot - base) * self._BITS_PER_TUBE
+
+    def dots(self, on):
+        """turn the dots on or off
+        """
+
+        self._dots = on
+        self._dots_bits = self._pack(
+            ((Ncs31x._UPPER_DOTS_MASK | Ncs31x._LOWER_DOTS_MASK) << 32
+             | Ncs31x._UPPER_DOTS_MASK | Ncs31x._LOWER_DOTS_MASK)) if on else 0
+
+    def encode(self, digits):
+        """encode a digit list into the frame buffer
+
+            digits: 0-9 or 0x20 for a blank tube
+            return the reused frame bytearray
+        """
+
+        tables = self._tables
+        nval = (tables[0][digits[0]]
+                | tables[1][digits[1]]
+                | tables[2][digits[2]]
+                | tables[3][digits[3]]
+                | tables[4][digits[4]]
+                | tables[5][digits[5]]
+                | self._dots_bits) & self._mask
+
+        pack_into('>Q', self._frame, 0, nval)
+
+        return self._frame
+
+    def __init__(self, ncs31x, dots, tube_mask):
+        """build the encoding tables for a board
+
+            ncs31x: the board, selects HV5122 or HV5222 packing
+            dots: dots on or off
+            tube_mask: 8 byte mask anded into every frame
+        """
+
+        self._hv5222 = ncs31x._hv5222
+
+        self._tables = [
+            [self._pack(cathode << self._shift(slot)) for cathode in self._CATHODES]
+            for slot in range(self._DIGITS)]
+
+        self._mask = self._pack(int.from_bytes(bytes(tube_mask), 'big'))
+        self.dots(dots)
+
+        self._frame = bytearray(8)
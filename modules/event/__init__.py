@@ -15,13 +15,20 @@
 """Manage retro events
 
 Classes:
+    Ev
     Event
 
 Functions:
 
     event(type_, arg)
+    listen(f)
+    name(type_)
+    parse(json_)
+    poll()
+    type(name)
     wait()
     send(ev)
+    stats()
 
 Misc variables:
 
@@ -30,73 +37,194 @@ Misc variables:
 """
 
 import json
+import pkgutil
 import sys
 import os
 
+from collections import deque
 from threading import Thread, Lock, Condition
-from time import localtime, strftime, time, sleep
-from datetime import datetime
+from time import localtime, strftime, time, sleep, monotonic_ns
 
 ##########
 #
 # event format:
 #
-# { "event" : arg }
+# Ev(type, arg, stamp)
 #
-# event:  button, alarm, ui-control
+# type:   index into the event types in conf.json
 # arg:    context-based
+# stamp:  monotonic_ns() at creation
+# queued: monotonic_ns() when last queued, see module latency
 #
-# sneak in a timestamp somehow?
+# the web UI speaks json, { "event" : arg }, see parse()
 #
 
+class Ev:
+    """an event
+    """
+
+    __slots__ = ('type', 'arg', 'stamp', 'queued')
+
+    def __init__(self, type_, arg, stamp):
+        self.type = type_
+        self.arg = arg
+        self.stamp = stamp
+        self.queued = stamp
+
 class Event:
     """the event class
+
+    the queue is FIFO within a priority class, lower classes
+    are delivered first. coalesced events (ticks) are queued
+    at most once, a stalled loop catches up with one of them
+    instead of replaying the backlog. when the queue is at
+    capacity new events are dropped and counted.
     """
 
-    VERSION = '0.0.3'
+    VERSION = '0.0.5'
 
     _conf_dict = None
 
-    _queue = None
+    # interned event types
+    _types = None
+    _names = None
+
+    _queues = None
     _queue_lock = None
     _queue_cv = None
 
+    _pending = None
+    _listener = None
+
+    # indexed by event type
+    _queued = None
+    _coalesce = None
+    _priorities = None
+
+    _capacity = None
+
+    _coalesced = None
+    _dropped = None
+
+    def _pop(self):
+        for queue in self._queues:
+            if queue:
+                ev = queue.popleft()
+                break
+
+        self._pending -= 1
+        self._queued[ev.type] = False
+
+        return ev
+
     def wait(self):
         """grab an event from the event queue
         """
 
         with self._queue_cv:
-            self._queue_cv.wait_for(lambda: len(self._queue))
-            return self._queue.pop()
-                
+            self._queue_cv.wait_for(lambda: self._pending)
+            return self._pop()
+
+    def poll(self):
+        """grab an event from the event queue if there is one
+        """
+
+        with self._queue_cv:
+            return self._pop() if self._pending else None
+
+    def listen(self, f):
+        """call f() after every event queued, eg. to wake an asyncio loop
+        """
+
+        self._listener = f
+
     def send(self, ev):
         """push an event on the event queue
+
+            return False if the event was coalesced or dropped
         """
 
+        type_ = ev.type
         with self._queue_cv:
-            self._queue.append(ev)
+            if self._queued[type_]:
+                self._coalesced += 1
+                return False
+
+            if self._capacity and self._pending >= self._capacity:
+                self._dropped += 1
+                return False
+
+            ev.queued = monotonic_ns()
+            self._queued[type_] = self._coalesce[type_]
+            self._queues[self._priorities[type_]].append(ev)
+            self._pending += 1
             self._queue_cv.notify()
 
+        if self._listener is not None:
+            self._listener()
+
+        return True
+
+    def stats(self):
+        """queue accounting
+        """
+
+        with self._queue_cv:
+            return {
+                'pending': self._pending,
+                'coalesced': self._coalesced,
+                'dropped': self._dropped,
+            }
+
+    def type(self, name):
+        """interned type of an event name
+        """
+
+        return self._types[name]
+
+    def name(self, type_):
+        """name of an interned event type
+        """
+
+        return self._names[type_]
+
     def event(self, type_, arg):
-        """create json event
+        """create an event
         """
 
-        fmt = '{{ "{}": "{}" }}'
+        return Ev(self._types[type_], arg, monotonic_ns())
+
+    def parse(self, json_):
+        """create an event from its json form, { "event": arg }
+        """
 
-        # print('event: ', end='')
-        # print(fmt.format(type_, arg))
-        # print(datetime.now().strftime('%H:%M:%S:%f'))
+        dict_ = json.loads(json_)
+        if len(dict_) != 1:
+            raise ValueError('malformed event: {}'.format(json_))
 
-        return json.loads(fmt.format(type_, arg))
+        type_, arg = next(iter(dict_.items()))
+
+        return self.event(type_, arg)
 
     def __init__(self):
         """create an event object
         """
 
-        self._conf_dict = []
-        with open(os.path.join(os.path.dirname(__file__), 'conf.json'), 'r') as file:
-            self._conf_dict = json.load(file)
+        # through the loader, so this works from a zipapp bundle
+        self._conf_dict = json.loads(pkgutil.get_data(__name__, 'conf.json'))
+
+        self._names = tuple(self._conf_dict['types'])
+        self._types = {name: type_ for type_, name in enumerate(self._names)}
+
+        self._capacity = self._conf_dict['capacity']
+        self._coalesce = [name in self._conf_dict['coalesce'] for name in self._names]
+        self._priorities = [self._conf_dict['priorities'].get(name, 0) for name in self._names]
 
         self._queue_lock = Lock()
         self._queue_cv = Condition(self._queue_lock)
-        self._queue = []
+        self._queues = [deque() for _ in range(max(self._priorities, default=0) + 1)]
+
+        self._pending = 0
+        self._queued = [False for _ in self._names]
+        self._coalesced = 0
+        self._dropped = 0
@@ -21,16 +21,27 @@ Classes:
 Functions:
 
     buttons()
+    clear()
     date()
+    dots(on)
+    play(sequence, done)
     time()
+    time_digits(time, hour12, zero_blank)
     display_numerals(digits)
 
     update_backlight(color)
 
 Misc variables:
 
-    _conf_dict
+    _backlight
+    _clock
+    _compiler
+    _config
+    _digits
     _dots
+    _encoder
+    _frame
+    _player
     _lock
     _tube_mask
 """
@@ -40,45 +51,58 @@ import time
 import pigpio
 import os
 
+from threading import Lock
 from time import localtime, strftime
-from threading import Timer
 from event import Event
 
 from ncs31x import Ncs31x
+from animation import Compiler, Player
+from backlight import Backlight
+from encoder import Encoder
+from shadow_clock import ShadowClock
 
 class GraAfch:
     """board utilities
     """
     VERSION = '0.0.1'
 
-    # seconds
-    _DEBOUNCE_DELAY = 0.015
-    _TOTAL_DELAY = 0.017
+    # button pin: press event, long press event, auto-repeat
+    _BUTTONS = {
+        Ncs31x.MODE_BUTTON_PIN: ('mode-button', 'mode-long', False),
+        Ncs31x.UP_BUTTON_PIN: ('up-button', 'up-long', True),
+        Ncs31x.DOWN_BUTTON_PIN: ('down-button', 'down-long', True),
+    }
 
-    # events
-    _INT_EDGE_RISING = 1
-    _INT_EDGE_FALLING = 0
+    _callbacks = None
+    _tick_offset = None
 
-    _mode_cb = None
-    _up_cb = None
-    _down_cb = None
+    # pin: tick at press, pin: repeat job
+    _button_lock = None
+    _pressed = None
+    _repeats = None
 
-    _mode_event = None
-    _up_event = None
-    _down_event = None
-        
     # ncs31x
     _ncs31x = None
     _gpio = None
+    _clock = None
+    _backlight = None
 
     # event framework
     _event = None
+    _scheduler = None
 
     # configuration
-    _conf_dict = None
+    _config = None
 
     # display
     _dots = None
+    _encoder = None
+    _frame = None
+    _digits = None
+
+    # animations
+    _compiler = None
+    _player = None
     _tube_mask = [255 for _ in range(8)]
 
     # def string_to_color(str_):
@@ -114,7 +138,7 @@ class GraAfch:
         def scale_(nval):
             return int(nval * (100 / 255))
 
-        self._ncs31x.backlight(
+        self._backlight.set(
             [scale_(color[0]),
              scale_(color[1]),
              scale_(color[2])])
@@ -122,90 +146,105 @@ class GraAfch:
     def display_numerals(self, digits):
         """stuff the tubes from decimal string
         """
-        
-        def tubes_(str_, start):
-            tube_map_ = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 0]
 
-            def digit_(digit):
-                return 10 if digit == 0x20 else digit
+        frame = self._encoder.encode(digits)
 
-            bits = (tube_map_[digit_(str_[start])]) << 20
-            bits |= (tube_map_[digit_(str_[start - 1])]) << 10
-            bits |= (tube_map_[digit_(str_[start - 2])])
+        # the tubes already show this frame
+        if frame == self._frame:
+            return
 
-            return bits
+        self._frame = bytearray(frame)
+        self._ncs31x.latch_frame(frame)
 
-        def dots_(bits):
-            if self._dots:
-                bits |= Ncs31x._LOWER_DOTS_MASK
-                bits |= Ncs31x._UPPER_DOTS_MASK
-            else:
-                bits &= ~Ncs31x._LOWER_DOTS_MASK
-                bits &= ~Ncs31x._UPPER_DOTS_MASK
+    def dots(self, on):
+        """light the dots, or not, from the next frame on
+        """
 
-            return bits
+        self._dots = on
+        self._encoder.dots(on)
+        self._frame = None
 
-        def fmt_(nval, buffer, start, off):
-            buffer[start] = (nval >> 24 & 0xff) & self._tube_mask[off]
-            buffer[start + 1] = ((nval >> 16) & 0xff) & self._tube_mask[off + 1]
-            buffer[start + 2] = ((nval >> 8) & 0xff) & self._tube_mask[off + 2]
-            buffer[start + 3] = (nval & 0xff) & self._tube_mask[off + 3]
+    def play(self, sequence, done=None):
+        """play a frame sequence, see module animation
+        """
 
-            return buffer
+        self._frame = None
+        self._player.play(sequence, done)
 
-        buffer = [0 for _ in range(8)]
+    def clear(self):
+        """turn off all tubes
+        """
 
-        left = tubes_(digits, Ncs31x._LEFT_REPR_START)
-        left = dots_(left)
-        fmt_(left, buffer, Ncs31x._LEFT_BUFFER_START, 0)
+        self._frame = None
+        self._ncs31x.clear()
 
-        right = tubes_(digits, Ncs31x._RIGHT_REPR_START)
-        right = dots_(right)
-        fmt_(right, buffer, Ncs31x._RIGHT_BUFFER_START, 4)
+    @staticmethod
+    def time_digits(time, hour12, zero_blank):
+        """the tube digits for a 24 hour struct_time
+        """
 
-        self._ncs31x.blank()
-        self._ncs31x.display(buffer)
-        self._ncs31x.unblank()
+        hour = time.tm_hour - 12 if hour12 and time.tm_hour > 12 else time.tm_hour
+        if zero_blank:
+            return [hour // 10 if hour // 10 else 0x20,
+                    hour % 10,
+                    time.tm_min // 10 if time.tm_min // 10 else 0x20,
+                    time.tm_min % 10,
+                    time.tm_sec // 10,
+                    time.tm_sec % 10,
+                    8,
+                    8,
+                    ]
+
+        return [hour // 10,
+                hour % 10,
+                time.tm_min // 10,
+                time.tm_min % 10,
+                time.tm_sec // 10,
+                time.tm_sec % 10,
+                8,
+                8,
+                ]
 
     def time(self):
         """format the current time onto the display
+
+            the minute changes with the configured animation
         """
         
-        time = self._ncs31x.read_rtc(self._conf_dict["time-format"] == "12hour")
-        if self._conf_dict["zero-blank"]:
-            self.display_numerals(
-                [time.tm_hour // 10 if time.tm_hour // 10 else 0x20,
-                 time.tm_hour % 10,
-                 time.tm_min // 10 if time.tm_hour // 10 else 0x20,
-                 time.tm_min % 10,
-                 time.tm_sec // 10,
-                 time.tm_sec % 10,
-                 8,
-                 8,
-                 ])
-        else:
-            self.display_numerals(
-                [time.tm_hour // 10,
-                 time.tm_hour % 10,
-                 time.tm_min // 10,
-                 time.tm_min % 10,
-                 time.tm_sec // 10,
-                 time.tm_sec % 10,
-                 8,
-                 8,
-                 ])
+        # an animation is on the tubes
+        if self._player.busy():
+            return
+
+        digits = self.time_digits(self._clock.read(False),
+                                  self._config.hour12,
+                                  self._config.zero_blank)
+
+        last, self._digits = self._digits, digits
+        if last is not None and last[3] != digits[3] and self._frame is not None:
+            if self._config.minute_animation == 'slot-machine':
+                self.play(self._compiler.slot_machine(last, digits))
+                return
+            if self._config.minute_animation == 'crossfade':
+                self.play(self._compiler.crossfade(last, digits))
+                return
+
+        self.display_numerals(digits)
 
-            
     def date(self):
         """format the current date  onto the display
         """
-        date = self._ncs31x.read_rtc(self._conf_dict["date-format"])
+
+        # an animation is on the tubes
+        if self._player.busy():
+            return
+
+        date = self._clock.read(False)
         
-        if self._conf_dict["zero-blank"]:
+        if self._config.zero_blank:
             self.display_numerals(
-                [date.tm_mday // 10 if time.tm_mday // 10 else 0x20,
+                [date.tm_mday // 10 if date.tm_mday // 10 else 0x20,
                  date.tm_mday % 10,
-                 date.tm_mon // 10 if time.tm_mon // 10 else 0x20,
+                 date.tm_mon // 10 if date.tm_mon // 10 else 0x20,
                  date.tm_mon % 10,
                  (date.tm_year - 2000) // 10,
                  (date.tm_year - 2000) % 10,
@@ -224,61 +263,103 @@ class GraAfch:
                  8,
                  ])
             
+    def _button(self, pin, level, tick):
+        """edge on a button pin, the buttons pull low when pressed
+
+            the press is sent on the falling edge, stamped with the
+            edge time from the daemon tick. the release measures the
+            press, a long press sends the long event with the press
+            duration in microseconds.
+        """
+
+        press, long_, repeat = self._BUTTONS[pin]
+
+        # microseconds since the edge, the glitch filter stamps
+        # edges once they have held steady
+        age = (self._scheduler.clock.monotonic_ns() // 1000 - self._tick_offset - tick) & 0xffffffff
+        age += self._config.button_glitch
+
+        if level == 0:
+            ev = self._event.event(press, 'down')
+            ev.stamp -= age * 1000
+
+            with self._button_lock:
+                if pin in self._pressed:
+                    return
+                self._pressed[pin] = tick
+                if repeat and self._config.button_repeat:
+                    self._repeats[pin] = self._scheduler.after(self._config.button_long_press,
+                                                               self._repeat, pin)
+            self._event.send(ev)
+        elif level == 1:
+            with self._button_lock:
+                if pin not in self._pressed:
+                    return
+                held = pigpio.tickDiff(self._pressed.pop(pin), tick)
+                job = self._repeats.pop(pin, None)
+                if job is not None:
+                    job.cancel()
+
+            if held >= self._config.button_long_press * 1e6:
+                ev = self._event.event(long_, held)
+                ev.stamp -= age * 1000
+                self._event.send(ev)
+
+    def _repeat(self, pin):
+        """start auto-repeating a held button
+        """
+
+        press, _, _ = self._BUTTONS[pin]
+        with self._button_lock:
+            if pin in self._pressed:
+                self._repeats[pin] = self._scheduler.every(
+                    self._config.button_repeat,
+                    lambda: self._event.send(self._event.event(press, 'repeat')))
+
     def buttons(self):
         """button events
+
+            pigpiod filters contact bounce, one callback per button
+            sees both edges for as long as we run
         """
-        def debounce_mode(pin, level, tick):
-            self._mode_cb.cancel()
-            self._event.send(self._mode_event)
-            Timer(self._DEBOUNCE_DELAY,
-                  lambda: self._gpio.callback(Ncs31x.MODE_BUTTON_PIN, self._INT_EDGE_RISING, debounce_mode),
-                  []).start()
-
-        def debounce_up(pin, level, tick):
-            self._up_cb.cancel()
-            self._event.send(self._up_event)
-            Timer(self._DEBOUNCE_DELAY,
-                  lambda: self._gpio.callback(Ncs31x.UP_BUTTON_PIN, self._INT_EDGE_RISING, debounce_up),
-                  []).start()
-
-        def debounce_down(pin, level, tick):
-            self._down_cb.cancel()
-            self._event.send(self._down_event)
-            Timer(self._DEBOUNCE_DELAY,
-                  lambda: self._gpio.callback(Ncs31x.DOWN_BUTTON_PIN, self._INT_EDGE_RISING, debounce_down),
-                  []).start()
-
-        self._ncs31x.init_pin(Ncs31x.UP_BUTTON_PIN)
-        self._ncs31x.init_pin(Ncs31x.DOWN_BUTTON_PIN)
-        self._ncs31x.init_pin(Ncs31x.MODE_BUTTON_PIN)
-
-        self._mode_cb = self._gpio.callback(Ncs31x.MODE_BUTTON_PIN, self._INT_EDGE_RISING,
-                                       debounce_mode)
-        self._up_cb = self._gpio.callback(Ncs31x.UP_BUTTON_PIN, self._INT_EDGE_RISING,
-                                     debounce_up)
-        self._down_cb = self._gpio.callback(Ncs31x.DOWN_BUTTON_PIN, self._INT_EDGE_RISING,
-                                     debounce_down)
-
-    def __init__(self, conf_dict, event):
+
+        self._button_lock = Lock()
+        self._pressed = {}
+        self._repeats = {}
+
+        # daemon tick to our monotonic microseconds
+        self._tick_offset = (self._scheduler.clock.monotonic_ns() // 1000
+                             - self._gpio.get_current_tick()) & 0xffffffff
+
+        self._callbacks = []
+        for pin in self._BUTTONS:
+            self._ncs31x.init_pin(pin, self._config.button_glitch)
+            self._callbacks.append(self._gpio.callback(pin, pigpio.EITHER_EDGE, self._button))
+
+    def __init__(self, config, event, scheduler, gpio=None):
         """initialize the gra-afch module
 
-            read the config file
+            keep the compiled config, see module config
             connect to the board
             blank the display and clear it
             set up button events
+
+            time comes from the scheduler's clock, see module clock
         """
 
-        self._conf_dict = conf_dict;
+        self._config = config
         
-        self._ncs31x = Ncs31x()
+        self._ncs31x = Ncs31x(gpio)
         self._gpio = self._ncs31x._gpio
+        self._clock = ShadowClock(self._ncs31x, config.rtc_resync, scheduler.clock)
         self._event = event
-        self._dots = conf_dict["dots"]
+        self._scheduler = scheduler
+        self._backlight = Backlight(self._ncs31x, scheduler)
+        self._dots = config.dots
+        self._encoder = Encoder(self._ncs31x, self._dots, self._tube_mask)
+        self._compiler = Compiler(self._encoder)
+        self._player = Player(self._ncs31x, clock=scheduler.clock)
 
-        self._mode_event = event.event("mode-button", "down")
-        self._up_event = event.event("up-button", "down")
-        self._down_event = event.event("down-button", "down")
-        
         self._ncs31x.blank()
         self._ncs31x.clear()
 
@@ -0,0 +1,232 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## http server
+##
+###########
+"""Concurrent WSGI serving for the web interface
+
+A bottle server adapter on the standard library wsgiref
+server. Connections are handed to a bounded pool of worker
+threads, HTTP/1.1 connections are kept alive between
+requests while responses carry a Content-Length, and every
+request can be logged with how long it took.
+
+A streaming route (the status stream, jyserver's long
+poll) would hold a worker for as long as the client stays
+connected, so a connection asking for one is handed off to
+a thread of its own and the pool stays free for everything
+else. Past max_streams open streams, the server answers
+503 and the client retries.
+
+Classes:
+
+    PoolServer
+
+Misc variables:
+
+    workers
+    keep_alive
+    log
+    streams
+    max_streams
+"""
+
+import logging
+import queue
+import socket
+
+from threading import BoundedSemaphore, Thread
+from time import monotonic_ns
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler, ServerHandler
+
+from bottle import ServerAdapter
+
+class _ServerHandler(ServerHandler):
+    """speak HTTP/1.1, and note whether the connection can be reused
+    """
+
+    http_version = '1.1'
+
+    def close(self):
+        if self.headers is None or 'Content-Length' not in self.headers:
+            self.request_handler.close_connection = True
+        super().close()
+
+class _RequestHandler(WSGIRequestHandler):
+    """serve requests on a connection until the client or the
+       response ends it
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    # the connection has been handed to a stream thread
+    detached = False
+
+    _start = None
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and not self.detached:
+            self.handle_one_request()
+
+    def finish(self):
+        if not self.detached:
+            super().finish()
+
+    def _stream(self):
+        """serve the connection from its own thread, then close it
+        """
+
+        try:
+            self._run()
+            while not self.close_connection:
+                self.handle_one_request()
+        except Exception:
+            self.server.handle_error(self.request, self.client_address)
+        finally:
+            self.server.release_stream()
+            super().finish()
+            self.server.shutdown_request(self.request)
+
+    def _detach(self):
+        """hand a streaming request off to a thread of its own
+
+            return False if there are too many streams open
+        """
+
+        if not self.server.acquire_stream():
+            return False
+
+        self.detached = True
+        Thread(target=self._stream, name='httpd-stream', daemon=True).start()
+
+        return True
+
+    def _run(self):
+        handler = _ServerHandler(self.rfile, self.wfile, self.get_stderr(), self.get_environ(),
+                                 multithread=True)
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except (socket.timeout, ConnectionError):
+            self.close_connection = True
+            return
+
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            return
+
+        self._start = monotonic_ns()
+        if not self.parse_request():
+            return
+
+        if self.request_version != 'HTTP/1.1':
+            self.close_connection = True
+
+        if not self.detached and self.path.split('?', 1)[0] in self.server.streams:
+            if not self._detach():
+                self.send_error(503, 'too many open streams')
+            return
+
+        self._run()
+
+    def log_request(self, code='-', size='-'):
+        if self.server.log:
+            self.server.log.info('%s "%s" %s %s %.2fms',
+                                 self.client_address[0], self.requestline, code, size,
+                                 (monotonic_ns() - self._start) / 1e6)
+
+    def log_message(self, format, *args):
+        if self.server.log:
+            self.server.log.warning('%s %s', self.client_address[0], format % args)
+
+class _PoolWSGIServer(WSGIServer):
+    """hand each connection to the worker pool, and streams to
+       threads of their own
+
+       the threads are daemons, an open status stream must not
+       hold up interpreter exit
+    """
+
+    log = None
+    streams = ()
+
+    _connections = None
+    _streams = None
+
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def _worker(self):
+        while True:
+            request, client_address = self._connections.get()
+            handler = None
+            try:
+                handler = self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                if handler is None or not handler.detached:
+                    self.shutdown_request(request)
+
+    def acquire_stream(self):
+        return self._streams.acquire(blocking=False)
+
+    def release_stream(self):
+        self._streams.release()
+
+    def start_workers(self, workers, max_streams):
+        self._connections = queue.Queue()
+        self._streams = BoundedSemaphore(max_streams)
+        for n in range(workers):
+            Thread(target=self._worker, name='httpd-{}'.format(n), daemon=True).start()
+
+    def process_request(self, request, client_address):
+        self._connections.put((request, client_address))
+
+class PoolServer(ServerAdapter):
+    """bottle server adapter
+
+    options:
+
+        workers:     worker threads
+        keep_alive:  seconds an idle connection is kept
+        log:         log every request with its duration
+        streams:     paths served on a thread of their own
+        max_streams: streams open at once
+    """
+
+    def run(self, app):
+        workers = self.options.get('workers', 16)
+        keep_alive = self.options.get('keep_alive', 5)
+
+        class RequestHandler(_RequestHandler):
+            timeout = keep_alive
+
+        server = make_server(self.host, self.port, app, _PoolWSGIServer, RequestHandler)
+        server.streams = frozenset(self.options.get('streams', ()))
+        server.start_workers(workers, self.options.get('max_streams', 64))
+        if self.options.get('log', False):
+            server.log = logging.getLogger('httpd')
+
+        self.port = server.server_port
+        server.serve_forever()
@@ -0,0 +1,206 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## latency histograms
+##
+###########
+"""Rolling log-linear latency histograms
+
+Values are nanoseconds, bucketed HDR style: exact below
+_SUB, then _SUB buckets per power of two, so every bucket
+is within about 6% of the values it holds and recording
+is a bit_length, a shift and an increment.
+
+Each histogram keeps the current window and the one before
+it, reports cover both, so the numbers describe the last
+one to two windows.
+
+Classes:
+
+    Histogram
+    Latency
+
+Functions:
+
+    event(ev, state, dequeued, done)
+    record(value, now)
+    report()
+
+Misc variables:
+
+    _window
+"""
+
+from time import monotonic_ns, time_ns
+
+class Histogram:
+    """rolling log-linear histogram
+    """
+
+    VERSION = '0.0.1'
+
+    _SUB = 16
+    _SUB_BITS = 4
+    _BUCKETS = 64 * 16
+
+    _window = None
+    _start = None
+    _current = None
+    _previous = None
+    _max = None
+
+    def _index(self, value):
+        if value < self._SUB:
+            return value
+
+        shift = value.bit_length() - self._SUB_BITS - 1
+        return shift * self._SUB + (value >> shift)
+
+    def _value(self, index):
+        if index < self._SUB:
+            return index
+
+        shift = index // self._SUB - 1
+        return (index % self._SUB + self._SUB) << shift
+
+    def record(self, value, now):
+        """record a value, now is monotonic_ns()
+        """
+
+        if now - self._start >= self._window:
+            self._previous = self._current
+            self._current = [0 for _ in range(self._BUCKETS)]
+            self._max = [self._max[1], 0]
+            self._start = now
+
+        if value < 0:
+            value = 0
+
+        self._current[self._index(value)] += 1
+        if value > self._max[1]:
+            self._max[1] = value
+
+    def report(self):
+        """p50, p99 and max over the current and previous window
+        """
+
+        counts = [c + p for c, p in zip(self._current, self._previous)]
+        total = sum(counts)
+        if not total:
+            return None
+
+        def percentile_(p):
+            rank = total * p / 100
+            seen = 0
+            for index, count in enumerate(counts):
+                seen += count
+                if seen >= rank:
+                    return self._value(index)
+
+        return {
+            'count': total,
+            'p50': percentile_(50),
+            'p99': percentile_(99),
+            'max': max(self._max),
+        }
+
+    def __init__(self, window):
+        """window: seconds per rolling window
+        """
+
+        self._window = int(window * 1e9)
+        self._start = monotonic_ns()
+        self._current = [0 for _ in range(self._BUCKETS)]
+        self._previous = [0 for _ in range(self._BUCKETS)]
+        self._max = [0, 0]
+
+class Latency:
+    """event latency tracker
+
+    dwell:    enqueue to dequeue, per event type
+    handler:  dequeue to handler complete, per state and event type
+    phase:    distance of a handled tick from the wall-clock second
+    input:    input edge (the event stamp) to dequeue, per input event type
+    """
+
+    VERSION = '0.0.1'
+
+    _event_names = None
+    _state_names = None
+    _tick = None
+
+    _dwell = None
+    _handler = None
+    _phase = None
+    _input = None
+
+    def event(self, ev, state, dequeued, done):
+        """record a dispatched event
+        """
+
+        type_ = ev.type
+        self._dwell[type_].record(dequeued - ev.queued, done)
+        self._handler[state * len(self._event_names) + type_].record(done - dequeued, done)
+
+        input_ = self._input[type_]
+        if input_ is not None:
+            input_.record(dequeued - ev.stamp, done)
+
+        if type_ == self._tick:
+            phase = time_ns() % 1000000000
+            self._phase.record(min(phase, 1000000000 - phase), done)
+
+    def report(self):
+        """nanosecond p50/p99/max for everything seen lately
+        """
+
+        n_events = len(self._event_names)
+
+        dwell = {}
+        for type_, name in enumerate(self._event_names):
+            report = self._dwell[type_].report()
+            if report:
+                dwell[name] = report
+
+        handler = {}
+        for state, state_name in enumerate(self._state_names):
+            for type_, name in enumerate(self._event_names):
+                report = self._handler[state * n_events + type_].report()
+                if report:
+                    handler['{}/{}'.format(state_name, name)] = report
+
+        input_ = {}
+        for type_, name in enumerate(self._event_names):
+            if self._input[type_] is not None:
+                report = self._input[type_].report()
+                if report:
+                    input_[name] = report
+
+        return {
+            'dwell': dwell,
+            'handler': handler,
+            'phase': self._phase.report(),
+            'input': input_,
+        }
+
+    def __init__(self, event_names, state_names, window=60, inputs=()):
+        """event_names, state_names: indexed by event type and state
+           window: seconds per rolling window
+           inputs: names of events stamped with the time of their input
+        """
+
+        self._event_names = event_names
+        self._state_names = state_names
+        self._tick = event_names.index('tick')
+
+        self._dwell = [Histogram(window) for _ in event_names]
+        self._handler = [Histogram(window) for _ in range(len(state_names) * len(event_names))]
+        self._phase = Histogram(window)
+        self._input = [Histogram(window) if name in inputs else None for name in event_names]
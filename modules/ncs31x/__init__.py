@@ -14,8 +14,10 @@
 """
 """
 
+import atexit
 import pigpio
-from time import struct_time
+from threading import RLock
+from time import struct_time, mktime, sleep
 
 class Ncs31x:
     """NCS31X class
@@ -88,8 +90,18 @@ class Ncs31x:
     _MONTH_REGISTER = 0x5
     _YEAR_REGISTER = 0x6
 
+    # DS3231 crystal trim, signed, about 0.1ppm per step
+    _AGING_REGISTER = 0x10
+
+    _RTC_REGISTERS = 7
+    _HOUR_MASK = 0x3f
+    _MONTH_MASK = 0x1f
+
     _MAX_POWER = 100
 
+    # microseconds
+    _LATCH_PULSE = 10
+
     _UPPER_DOTS_MASK = 0x80000000
     _LOWER_DOTS_MASK = 0x40000000
 
@@ -98,139 +110,350 @@ class Ncs31x:
     _RIGHT_REPR_START = 2
     _RIGHT_BUFFER_START = 4
 
+    _REVERSE_BITS = bytes(int('{:08b}'.format(n)[::-1], 2) for n in range(256))
+
+    # daemon-side command sequences, see
+    # http://abyz.me.uk/rpi/pigpio/pigs.html#Scripts
+    #
+    # backlight: p0-p2 red, green, blue
+    #
+    # pigpiod doesn't allow the SPI commands in scripts, so
+    # frames are always shifted and latched by the host
+    _SCRIPTS = {
+        'backlight': 'pwm {red} p0 pwm {green} p1 pwm {blue} p2',
+    }
+
+    # seconds
+    _SCRIPT_POLL = 0.01
+    _SCRIPT_POLLS = 50
+
     # class variables
     _gpio = None
     _gpio_i2c = None
     _gpio_spi = None
     
+    _own_gpio = None
     _hv5222 = None
 
+    # blank() holds LE low until unblank(), _le is where we left it.
+    # the player and the event loop both drive LE, _le_lock keeps
+    # a shift and its latch whole against a blank or unblank
+    _blanked = None
+    _le = None
+    _le_lock = None
+
+    _scripts = None
+
     def clear(self):
         """turn off all tubes
         """
 
-        self.display([0 for _ in range(8)])
+        with self._le_lock:
+            self.display([0 for _ in range(8)])
+            self.latch()
         
     def blank(self):
         """power off the display
         """
 
-        self._gpio.write(self.LE_PIN, 0)
+        with self._le_lock:
+            self._blanked = True
+            self._le = 0
+            self._gpio.write(self.LE_PIN, 0)
 
     def unblank(self):
         """power on the display
         """
 
-        self._gpio.write(self.LE_PIN, 1)
+        # LE is wherever it was left, lower it before the first frame
+        with self._le_lock:
+            self._blanked = False
+            self._le = 1
+            self._gpio.write(self.LE_PIN, 1)
+
+    def latch(self):
+        """strobe LE high to latch the shifted frame into the tubes
+
+            LE is left low, ready for the next frame. a blanked
+            display is left alone, unblank() shows the last frame
+        """
+
+        with self._le_lock:
+            if self._blanked:
+                return
+
+            self._le = 0
+            self._gpio.gpio_trigger(self.LE_PIN, self._LATCH_PULSE, 1)
+
+    def _shift(self, data):
+        """shift data into the registers with LE low, so the tubes
+           keep the last latched frame until latch()
+        """
+
+        with self._le_lock:
+            if self._le:
+                self._le = 0
+                self._gpio.write(self.LE_PIN, 0)
+
+            self._gpio.spi_write(self._gpio_spi, data)
+
+    def latch_frame(self, frame):
+        """write an already packed frame and latch it into the tubes
+        """
+
+        with self._le_lock:
+            self.write_frame(frame)
+            self.latch()
 
     def backlight(self, color):
         """change the backlight color
         """
 
+        if self._run_script('backlight', color):
+            return
+
         self._gpio.set_PWM_dutycycle(self.RED_LIGHT_PIN, color[0])
         self._gpio.set_PWM_dutycycle(self.GREEN_LIGHT_PIN, color[1])
         self._gpio.set_PWM_dutycycle(self.BLUE_LIGHT_PIN, color[2])
 
-    def write_rtc(self, tm):
+    def write_rtc(self, tm, tolerance=None):
         """write the RTC from a time struct
+
+            the time registers are written in a single block
+            transaction, or one at a time if the daemon refuses
+            the block write. if tolerance is not None, read the RTC
+            first and leave it alone when it is within tolerance
+            seconds of tm.
+
+            return True if the RTC was written
         """
         def _dec_to_bcd(val):
             return (int(val / 10) * 16) + (val % 10)
 
+        if tolerance is not None:
+            if abs(mktime(self.read_rtc(False)) - mktime(tm)) <= tolerance:
+                return False
+
+        regs = [_dec_to_bcd(tm.tm_sec),
+                _dec_to_bcd(tm.tm_min),
+                _dec_to_bcd(tm.tm_hour),
+                _dec_to_bcd(tm.tm_wday),
+                _dec_to_bcd(tm.tm_mday),
+                _dec_to_bcd(tm.tm_mon),
+                _dec_to_bcd(tm.tm_year - 2000)]
+
+        try:
+            self._gpio.i2c_write_i2c_block_data(self._gpio_i2c,
+                                                self._SECOND_REGISTER,
+                                                regs)
+        except pigpio.error:
+            self._write_rtc_registers(regs)
+
+        return True
+
+    def aging(self):
+        """the DS3231 aging offset, -128 to 127
+        """
+
+        val = self._gpio.i2c_read_byte_data(self._gpio_i2c, self._AGING_REGISTER)
+
+        return val - 256 if val > 127 else val
+
+    def write_aging(self, offset):
+        """trim the DS3231 oscillator, positive offsets slow it down
+        """
+
+        self._gpio.i2c_write_byte_data(self._gpio_i2c, self._AGING_REGISTER, offset & 0xff)
+
+    def _write_rtc_registers(self, regs):
+        """write the RTC time registers one at a time
+        """
+
         self._gpio.i2c_write_byte(self._gpio_i2c, self.I2C_FLUSH)
-        self._gpio.i2c_write_byte_data(self._gpio_i2c, self._SECOND_REGISTER,
-                                       _dec_to_bcd(tm.tm_sec))
-        self._gpio.i2c_write_byte_data(self._gpio_i2c, self._MINUTE_REGISTER,
-                                      _dec_to_bcd(tm.tm_min))
-        self._gpio.i2c_write_byte_data(self._gpio_i2c, self._HOUR_REGISTER,
-                                      _dec_to_bcd(tm.tm_hour))
-        self._gpio.i2c_write_byte_data(self._gpio_i2c, self._WEEK_REGISTER,
-                                      _dec_to_bcd(tm.tm_wday))
-        self._gpio.i2c_write_byte_data(self._gpio_i2c, self._DAY_REGISTER,
-                                      _dec_to_bcd(tm.tm_mday))
-        self._gpio.i2c_write_byte_data(self._gpio_i2c, self._MONTH_REGISTER,
-                                      _dec_to_bcd(tm.tm_mon))
-        self._gpio.i2c_write_byte_data(self._gpio_i2c, self._YEAR_REGISTER,
-                                      _dec_to_bcd(tm.tm_year - 2000))
+        for reg, val in enumerate(regs):
+            self._gpio.i2c_write_byte_data(self._gpio_i2c, reg, val)
         self._gpio.i2c_write_byte(self._gpio_i2c, self.I2C_FLUSH)
 
     def read_rtc(self, hour12):
         """read the RTC
             return a struct_time()
+
+            the time registers are fetched in a single block
+            transaction, so the seconds can't roll over between
+            reads and tear the time. if the block read comes up
+            short, fall back to reading the registers one at a time.
         """
-        
+
         def _bcd_to_dec(val):
             return ((val >> 4) * 10) + (val & 0xf)
 
-        def _hour12():
-            tm_hour = _bcd_to_dec(self._gpio.i2c_read_byte_data(self._gpio_i2c, self._HOUR_REGISTER))
-            if hour12 and tm_hour > 12:
-                tm_hour -= 12
-
-            return tm_hour
-
-        self._gpio.i2c_write_byte(self._gpio_i2c, self.I2C_FLUSH)
-
-        now = (_bcd_to_dec(self._gpio.i2c_read_byte_data(self._gpio_i2c, self._YEAR_REGISTER)) + 2000,
-               _bcd_to_dec(self._gpio.i2c_read_byte_data(self._gpio_i2c, self._MONTH_REGISTER)),
-               _bcd_to_dec(self._gpio.i2c_read_byte_data(self._gpio_i2c, self._DAY_REGISTER)),
-               _hour12(),
-               _bcd_to_dec(self._gpio.i2c_read_byte_data(self._gpio_i2c, self._MINUTE_REGISTER)),
-               _bcd_to_dec(self._gpio.i2c_read_byte_data(self._gpio_i2c, self._SECOND_REGISTER)),
-               _bcd_to_dec(self._gpio.i2c_read_byte_data(self._gpio_i2c, self._WEEK_REGISTER)),
+        count, regs = self._gpio.i2c_read_i2c_block_data(self._gpio_i2c,
+                                                         self._SECOND_REGISTER,
+                                                         self._RTC_REGISTERS)
+        if count != self._RTC_REGISTERS:
+            regs = self._read_rtc_registers()
+
+        tm_hour = _bcd_to_dec(regs[self._HOUR_REGISTER] & self._HOUR_MASK)
+        if hour12 and tm_hour > 12:
+            tm_hour -= 12
+
+        now = (_bcd_to_dec(regs[self._YEAR_REGISTER]) + 2000,
+               _bcd_to_dec(regs[self._MONTH_REGISTER] & self._MONTH_MASK),
+               _bcd_to_dec(regs[self._DAY_REGISTER]),
+               tm_hour,
+               _bcd_to_dec(regs[self._MINUTE_REGISTER]),
+               _bcd_to_dec(regs[self._SECOND_REGISTER]),
+               _bcd_to_dec(regs[self._WEEK_REGISTER]),
                1,
                -1)
 
         return struct_time(now)
 
+    def _read_rtc_registers(self):
+        """read the RTC time registers one at a time
+        """
+
+        self._gpio.i2c_write_byte(self._gpio_i2c, self.I2C_FLUSH)
+
+        return [self._gpio.i2c_read_byte_data(self._gpio_i2c, reg)
+                for reg in range(self._RTC_REGISTERS)]
+
     def display(self, tubes):
         """put the tube representation into the tubes
         """
 
-        def rev_bits(nval):
-            reversed_ = 0
-            i = 0
-            while i < 64:
-                if nval & 1 << i:
-                    reversed_ |= 1 << (63 - i)
+        display_ = tubes
+        if self._hv5222:
+            # the HV5222 shifts the other way: swap the
+            # halves and reverse the bits in each byte
+            display_ = [self._REVERSE_BITS[tubes[(n + 4) % 8]] for n in range(8)]
+
+        self._shift(bytes(display_))
 
-            return reversed_
+    def write_frame(self, frame):
+        """write an already packed frame, see module encoder
+        """
 
-        def tube_to_bits(tubes):
-            bits = 0
-            for n in range(8):
-                bits |= tubes[n]
-                bits <<= 8
+        self._shift(frame)
 
-            return bits
+    def _run_script(self, name, params):
+        """run a stored script
 
-        display_ = tubes
-        if self._hv5222:
-            reverse = rev_bits(tube_to_bits(display_))
+            return False if the script isn't available and the
+            caller has to fall back to individual commands
+        """
+
+        script = self._scripts.get(name)
+        if script is None:
+            return False
+
+        try:
+            self._gpio.run_script(script, params)
+        except pigpio.error:
+            return False
+
+        return True
+
+    def store_script(self, text):
+        """store a script in the daemon and wait for it to compile
+
+            return the script id, or None if the daemon refuses it
+        """
+
+        try:
+            script = self._gpio.store_script(text.encode())
+        except pigpio.error:
+            return None
+
+        for _ in range(self._SCRIPT_POLLS):
+            status, _ = self._gpio.script_status(script)
+            if status != pigpio.PI_SCRIPT_INITING:
+                break
+            sleep(self._SCRIPT_POLL)
+
+        if status != pigpio.PI_SCRIPT_HALTED:
+            self._gpio.delete_script(script)
+            return None
 
-            display_[4] = reverse
-            display_[5] = reverse >> 8
-            display_[6] = reverse >> 16
-            display_[7] = reverse >> 24
-            display_[0] = reverse >> 32
-            display_[1] = reverse >> 40
-            display_[2] = reverse >> 48
-            display_[3] = reverse >> 56
+        return script
 
-        self._gpio.spi_write(self._gpio_spi, bytes(display_))
+    def _store_scripts(self):
+        """compile the command sequences into daemon-side scripts
 
-    def init_pin(self, pin):
+            anything the daemon refuses is left to the per-call path
+        """
+
+        for name, text in self._SCRIPTS.items():
+            script = self.store_script(text.format(red=self.RED_LIGHT_PIN,
+                                                   green=self.GREEN_LIGHT_PIN,
+                                                   blue=self.BLUE_LIGHT_PIN))
+            if script is not None:
+                self._scripts[name] = script
+
+    def _delete_scripts(self):
+        """release our scripts in the daemon
+        """
+
+        for script in self._scripts.values():
+            try:
+                self._gpio.delete_script(script)
+            except pigpio.error:
+                pass
+
+        self._scripts = {}
+
+    def close(self):
+        """release everything we hold in the daemon, and the
+           connection if we made it
+        """
+
+        if self._gpio is None:
+            return
+
+        atexit.unregister(self.close)
+        self._delete_scripts()
+
+        for close_, handle in ((self._gpio.i2c_close, self._gpio_i2c),
+                               (self._gpio.spi_close, self._gpio_spi)):
+            if handle is not None and handle >= 0:
+                try:
+                    close_(handle)
+                except pigpio.error:
+                    pass
+
+        if self._own_gpio:
+            self._gpio.stop()
+
+        self._gpio = None
+        self._gpio_i2c = None
+        self._gpio_spi = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def init_pin(self, pin, steady=0):
         """set a GPIO pin to input and pulled-up
+
+            steady: microseconds a level must hold before pigpiod
+                    reports it, 0 for no glitch filter
         """
 
         self._gpio.set_mode(pin, pigpio.INPUT)
         self._gpio.set_pull_up_down(pin, pigpio.PUD_UP)
+        if steady:
+            self._gpio.set_glitch_filter(pin, steady)
 
-    def __init__(self):
+    def __init__(self, gpio=None):
         """initialize an ncs31x object
+
+            gpio: a connected pigpio.pi, defaults to the local daemon
         """
 
-        self._gpio = pigpio.pi()
+        self._own_gpio = gpio is None
+        self._gpio = pigpio.pi() if gpio is None else gpio
 
         # wiringpi.softToneCreate(BUZZER_PIN)
         # wiringpi.softToneWrite(BUZZER_PIN, 1000)
@@ -248,7 +471,16 @@ class Ncs31x:
         
         # initialize the display
         self._gpio.set_mode(self.LE_PIN, pigpio.OUTPUT)
+        # LE is wherever it was left, lower it before the first frame
+        self._blanked = False
+        self._le = 1
+        self._le_lock = RLock()
         self._gpio.set_mode(self.R5222_PIN, pigpio.INPUT)
         self._gpio.set_pull_up_down(self.R5222_PIN, pigpio.PUD_UP)
         self._hv5222 = not self._gpio.read(self.R5222_PIN)
 
+        # batch the common sequences into daemon-side scripts
+        self._scripts = {}
+        self._store_scripts()
+        atexit.register(self.close)
+
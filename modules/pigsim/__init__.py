@@ -0,0 +1,521 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## pigpiod stand-in
+##
+###########
+"""Emulate pigpiod and an NCS31X hat
+
+A drop-in replacement for pigpio.pi covering what the
+retro modules use: GPIO levels and modes, PWM, I2C with a
+simulated DS3231 register file, SPI with frame capture,
+edge callbacks, the LE trigger pulse and the small subset
+of the script language that ncs31x stores in the daemon.
+Like pigpiod, it refuses scripts using the commands that
+aren't valid in scripts, SPI and I2C transfers among them.
+
+Every call counts as one pigpiod round trip and can be
+slowed down by a fixed latency to model the socket. Like
+a socket read, a long round trip sleeps and lets other
+threads run, only the last stretch is spun for accuracy.
+
+The RTC, daemon ticks, frame stamps and button presses run
+on a clock, see module clock. On a virtual clock the round
+trip latency is still real time, it models cost, not time.
+
+Classes:
+
+    DS3231
+    Pi
+
+Functions:
+
+    press(pin, duration)
+    set_level(pin, level)
+
+Misc variables:
+
+    calls
+    frames
+    latency
+    writes
+"""
+
+import time
+import pigpio
+
+from collections import deque
+from threading import Lock, Thread
+from time import localtime, mktime, perf_counter, struct_time
+
+from clock import SYSTEM
+
+from ncs31x import Ncs31x
+
+class DS3231:
+    """DS3231 register file
+
+    the time registers are computed from the host clock,
+    offset by whatever was last written and skewed by
+    drift parts per million, less 0.1ppm per step of the
+    aging register.
+    """
+
+    VERSION = '0.0.1'
+
+    _REGISTERS = 0x13
+    _TIME_REGISTERS = 7
+    _AGING_REGISTER = 0x10
+    _AGING_PPM = 0.1
+
+    regs = None
+    drift = None
+
+    _clock = None
+    _epoch = None
+    _set_at = None
+
+    def _rate(self):
+        aging = self.regs[self._AGING_REGISTER]
+        aging = aging - 256 if aging > 127 else aging
+
+        return 1 + (self.drift - aging * self._AGING_PPM) * 1e-6
+
+    def now(self):
+        """the RTC's idea of the time in epoch seconds
+        """
+
+        host = self._clock()
+        return self._epoch + (host - self._set_at) * self._rate()
+
+    def set(self, epoch):
+        """set the RTC, this restarts the seconds countdown
+        """
+
+        self._epoch = float(int(epoch))
+        self._set_at = self._clock()
+
+    def read(self, reg, count):
+        """read count registers starting at reg
+        """
+
+        def _dec_to_bcd(val):
+            return (val // 10) * 16 + val % 10
+
+        if reg < self._TIME_REGISTERS:
+            tm = localtime(self.now())
+            self.regs[0:self._TIME_REGISTERS] = bytes(
+                [_dec_to_bcd(tm.tm_sec),
+                 _dec_to_bcd(tm.tm_min),
+                 _dec_to_bcd(tm.tm_hour),
+                 _dec_to_bcd(tm.tm_wday),
+                 _dec_to_bcd(tm.tm_mday),
+                 _dec_to_bcd(tm.tm_mon),
+                 _dec_to_bcd(tm.tm_year - 2000)])
+
+        return bytearray(self.regs[reg:reg + count])
+
+    def write(self, reg, data):
+        """write registers starting at reg
+        """
+
+        def _bcd_to_dec(val):
+            return ((val >> 4) * 10) + (val & 0xf)
+
+        if reg < self._TIME_REGISTERS:
+            self.read(0, self._TIME_REGISTERS)
+
+        # a new trim only changes the rate from here on
+        if reg <= self._AGING_REGISTER < reg + len(data):
+            self._epoch, self._set_at = self.now(), self._clock()
+
+        self.regs[reg:reg + len(data)] = bytes(data)
+
+        if reg < self._TIME_REGISTERS:
+            regs = self.regs
+            self.set(mktime(struct_time(
+                (_bcd_to_dec(regs[6]) + 2000,
+                 _bcd_to_dec(regs[5] & 0x1f),
+                 _bcd_to_dec(regs[4]),
+                 _bcd_to_dec(regs[2] & 0x3f),
+                 _bcd_to_dec(regs[1]),
+                 _bcd_to_dec(regs[0]),
+                 0, 1, -1))))
+
+    def __init__(self, clock=time.time, drift=0.0):
+        self.regs = bytearray(self._REGISTERS)
+        self.drift = drift
+        self._clock = clock
+        self.set(clock())
+
+class _Callback:
+    """pigpio._callback work-alike
+    """
+
+    _pi = None
+    _gpio = None
+    _edge = None
+    _func = None
+
+    def cancel(self):
+        self._pi._cancel(self)
+
+    def __init__(self, pi, gpio, edge, func):
+        self._pi = pi
+        self._gpio = gpio
+        self._edge = edge
+        self._func = func
+
+class Pi:
+    """pigpio.pi stand-in
+    """
+
+    VERSION = '0.0.1'
+
+    connected = True
+
+    # seconds per round trip
+    latency = None
+
+    calls = None
+
+    # seconds of a round trip spun rather than slept
+    _SPIN = 0.0001
+
+    # SPI writes, frames keeps the last of them
+    frames = None
+    writes = None
+    rtc = None
+
+    levels = None
+    modes = None
+    pwm = None
+    pwm_range = None
+
+    _clock = None
+    _lock = None
+    _callbacks = None
+    _handles = None
+    _scripts = None
+    _script_storage = None
+    _running = None
+    _glitch = None
+
+    # script commands understood, with their argument counts
+    _SCRIPT_COMMANDS = {
+        'pwm': 2,
+        'w': 2,
+        'trig': 3,
+        'mils': 1,
+        'mics': 1,
+        'tag': 1,
+        'jmp': 1,
+    }
+
+    # commands pigpiod's command table marks as not valid in
+    # scripts, the ones that move a buffer of bytes
+    _NOT_IN_SCRIPTS = frozenset((
+        'bi2cz', 'bscx', 'bspix', 'fc', 'fl', 'fo', 'fr', 'fw',
+        'i2cpk', 'i2crd', 'i2cri', 'i2cwd', 'i2cwi', 'i2cz',
+        'proc', 'procp', 'serr', 'serw', 'slr',
+        'spir', 'spiw', 'spix', 'wvag', 'wvas',
+    ))
+
+    def _call(self):
+        """account for one round trip
+        """
+
+        self.calls += 1
+        if self.latency:
+            end = perf_counter() + self.latency
+            if self.latency > 2 * self._SPIN:
+                time.sleep(self.latency - self._SPIN)
+            while perf_counter() < end:
+                pass
+
+    def _tick(self):
+        return (self._clock.monotonic_ns() // 1000) & 0xffffffff
+
+    def _open(self, kind, arg):
+        handle = len(self._handles)
+        self._handles.append((kind, arg))
+        return handle
+
+    def _cancel(self, cb):
+        with self._lock:
+            if cb in self._callbacks:
+                self._callbacks.remove(cb)
+
+    # board side
+    def set_level(self, pin, level, tick=None):
+        """drive an input pin, firing any callbacks on the edge
+        """
+
+        if self.levels.get(pin, 1) == level:
+            return
+
+        self.levels[pin] = level
+        tick = self._tick() if tick is None else tick
+        with self._lock:
+            callbacks = [cb for cb in self._callbacks if cb._gpio == pin]
+
+        for cb in callbacks:
+            if (cb._edge == pigpio.EITHER_EDGE
+                or (cb._edge == pigpio.RISING_EDGE and level == 1)
+                or (cb._edge == pigpio.FALLING_EDGE and level == 0)):
+                cb._func(pin, level, tick)
+
+    def press(self, pin, duration=0.05):
+        """press and hold a (pulled up) button for duration seconds
+
+            presses shorter than the pin's glitch filter are not seen,
+            like pigpiod the edges arrive stamped steady microseconds
+            after they happened
+        """
+
+        steady = self._glitch.get(pin, 0) / 1e6
+        if duration < steady:
+            return
+
+        self._clock.sleep(steady)
+        self.set_level(pin, 0)
+        self._clock.sleep(duration)
+        self.set_level(pin, 1)
+
+    # pigpio.pi
+    def stop(self):
+        self.connected = False
+
+    def get_current_tick(self):
+        self._call()
+        return self._tick()
+
+    def set_mode(self, gpio, mode):
+        self._call()
+        self.modes[gpio] = mode
+        return 0
+
+    def get_mode(self, gpio):
+        self._call()
+        return self.modes.get(gpio, pigpio.INPUT)
+
+    def set_pull_up_down(self, gpio, pud):
+        self._call()
+        if gpio not in self.levels:
+            self.levels[gpio] = 1 if pud == pigpio.PUD_UP else 0
+        return 0
+
+    def read(self, gpio):
+        self._call()
+        return self.levels.get(gpio, 1)
+
+    def write(self, gpio, level):
+        self._call()
+        self.levels[gpio] = level
+        return 0
+
+    def gpio_trigger(self, user_gpio, pulse_len=10, level=1):
+        self._call()
+        self.levels[user_gpio] = 0 if level else 1
+        return 0
+
+    def set_glitch_filter(self, user_gpio, steady):
+        self._call()
+        self._glitch[user_gpio] = steady
+        return 0
+
+    def set_PWM_range(self, user_gpio, range_):
+        self._call()
+        self.pwm_range[user_gpio] = range_
+        return 0
+
+    def get_PWM_range(self, user_gpio):
+        self._call()
+        return self.pwm_range.get(user_gpio, 255)
+
+    def set_PWM_dutycycle(self, user_gpio, dutycycle):
+        self._call()
+        self.pwm[user_gpio] = dutycycle
+        return 0
+
+    def get_PWM_dutycycle(self, user_gpio):
+        self._call()
+        return self.pwm.get(user_gpio, 0)
+
+    def i2c_open(self, i2c_bus, i2c_address, i2c_flags=0):
+        self._call()
+        return self._open('i2c', i2c_address)
+
+    def i2c_close(self, handle):
+        self._call()
+        return 0
+
+    def i2c_write_byte(self, handle, byte_val):
+        self._call()
+        return 0
+
+    def i2c_read_byte_data(self, handle, reg):
+        self._call()
+        return self.rtc.read(reg, 1)[0]
+
+    def i2c_write_byte_data(self, handle, reg, byte_val):
+        self._call()
+        self.rtc.write(reg, [byte_val])
+        return 0
+
+    def i2c_read_i2c_block_data(self, handle, reg, count):
+        self._call()
+        data = self.rtc.read(reg, count)
+        return len(data), data
+
+    def i2c_write_i2c_block_data(self, handle, reg, data):
+        self._call()
+        self.rtc.write(reg, data)
+        return 0
+
+    def spi_open(self, spi_channel, baud, spi_flags=0):
+        self._call()
+        return self._open('spi', spi_channel)
+
+    def spi_close(self, handle):
+        self._call()
+        return 0
+
+    def spi_write(self, handle, data):
+        self._call()
+        self.writes += 1
+        self.frames.append((self._clock.monotonic_ns(), bytes(data)))
+        return len(data)
+
+    def callback(self, user_gpio, edge=pigpio.RISING_EDGE, func=None):
+        self._call()
+        cb = _Callback(self, user_gpio, edge, func)
+        with self._lock:
+            self._callbacks.append(cb)
+
+        return cb
+
+    def store_script(self, script):
+        self._call()
+        if not self._script_storage:
+            raise pigpio.error('no memory for scripts')
+
+        tokens = script.decode().split()
+        program = []
+        while tokens:
+            cmd = tokens.pop(0)
+            if cmd in self._NOT_IN_SCRIPTS or cmd not in self._SCRIPT_COMMANDS:
+                raise pigpio.error('illegal script command')
+            nargs = self._SCRIPT_COMMANDS[cmd]
+            args, tokens = tokens[:nargs], tokens[nargs:]
+            program.append((cmd, args))
+
+        self._scripts.append(program)
+        return len(self._scripts) - 1
+
+    def script_status(self, script_id):
+        self._call()
+        if self._scripts[script_id] is None:
+            return pigpio.PI_BAD_SCRIPT_ID, ()
+
+        if script_id in self._running:
+            return pigpio.PI_SCRIPT_RUNNING, ()
+
+        return pigpio.PI_SCRIPT_HALTED, ()
+
+    def delete_script(self, script_id):
+        self._call()
+        self._running.discard(script_id)
+        self._scripts[script_id] = None
+        return 0
+
+    def stop_script(self, script_id):
+        self._call()
+        if self._scripts[script_id] is None:
+            raise pigpio.error('unknown script id')
+
+        self._running.discard(script_id)
+        return 0
+
+    def _interpret(self, script_id, program, params):
+        """run a program, a script that waits runs until it ends or is stopped
+        """
+
+        def arg_(arg):
+            return params[int(arg[1:])] if arg.startswith('p') else int(arg)
+
+        tags = {int(args[0]): pc for pc, (cmd, args) in enumerate(program) if cmd == 'tag'}
+
+        pc = 0
+        while pc < len(program):
+            cmd, args = program[pc]
+            args = [arg_(arg) for arg in args]
+            pc += 1
+            if cmd == 'pwm':
+                self.pwm[args[0]] = args[1]
+            elif cmd == 'w':
+                self.levels[args[0]] = args[1]
+            elif cmd == 'trig':
+                self.levels[args[0]] = 0 if args[2] else 1
+            elif cmd == 'jmp':
+                pc = tags[args[0]]
+            elif cmd in ('mils', 'mics'):
+                time.sleep(args[0] / (1000 if cmd == 'mils' else 1000000))
+                if script_id not in self._running:
+                    return
+
+        self._running.discard(script_id)
+
+    def run_script(self, script_id, params=None):
+        self._call()
+        program = self._scripts[script_id]
+        if program is None:
+            raise pigpio.error('unknown script id')
+
+        params = list(params or [])
+        if any(cmd in ('mils', 'mics') for cmd, _ in program):
+            self._running.add(script_id)
+            Thread(target=self._interpret, args=(script_id, program, params), daemon=True).start()
+        else:
+            self._interpret(script_id, program, params)
+
+        return 0
+
+    def __init__(self, latency=0.0, hv5222=False, clock=SYSTEM, drift=0.0, frames=4096,
+                 scripts=True):
+        """create a stand-in daemon and board
+
+            latency: seconds added to every round trip
+            hv5222: strap the board as an HV5222
+            clock: the time source, see module clock
+            drift: RTC drift in ppm
+            frames: SPI frames kept
+            scripts: take scripts, a daemon out of script memory doesn't
+        """
+
+        self.latency = latency
+        self.calls = 0
+        self.frames = deque(maxlen=frames)
+        self.writes = 0
+        self.rtc = DS3231(clock.time, drift)
+
+        self.levels = {Ncs31x.R5222_PIN: 0 if hv5222 else 1}
+        self.modes = {}
+        self.pwm = {}
+        self.pwm_range = {}
+
+        self._clock = clock
+        self._script_storage = scripts
+        self._lock = Lock()
+        self._callbacks = []
+        self._handles = []
+        self._scripts = []
+        self._running = set()
+        self._glitch = {}
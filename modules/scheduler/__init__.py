@@ -0,0 +1,237 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## scheduler
+##
+###########
+"""Run timers from a single thread
+
+Timers are kept in a heap ordered by absolute monotonic
+deadline. Repeating timers are rescheduled from their
+previous deadline rather than from when their callback
+finished, so they don't drift, and a late timer skips
+the periods it missed instead of firing a burst.
+
+Deadlines are on the scheduler's clock, see module clock.
+On a virtual clock there is no thread: whoever drives the
+clock moves it to next_deadline() and calls run_due().
+
+Classes:
+
+    Job
+    Scheduler
+
+Functions:
+
+    after(delay, f, *args)
+    cancel(job)
+    every(interval, f, *args)
+    next_deadline()
+    run_due()
+    stop()
+
+Misc variables:
+
+    clock
+    _heap
+    _thread
+"""
+
+import heapq
+import traceback
+
+from threading import Thread, Lock, Condition
+
+from clock import SYSTEM
+
+class Job:
+    """a scheduled callback
+    """
+
+    deadline = None
+    interval = None
+    cancelled = None
+
+    _scheduler = None
+    _f = None
+    _args = None
+
+    def cancel(self):
+        """stop the job from firing again
+        """
+
+        self._scheduler.cancel(self)
+
+    def __init__(self, scheduler, deadline, interval, f, args):
+        self.deadline = deadline
+        self.interval = interval
+        self.cancelled = False
+
+        self._scheduler = scheduler
+        self._f = f
+        self._args = args
+
+class Scheduler:
+    """the scheduler class
+    """
+
+    VERSION = '0.0.1'
+
+    # the time source, see module clock
+    clock = None
+
+    _heap = None
+    _seq = None
+    _lock = None
+    _cv = None
+
+    _thread = None
+    _running = None
+
+    def _push(self, job):
+        self._seq += 1
+        heapq.heappush(self._heap, (job.deadline, self._seq, job))
+
+    def _top(self):
+        """deadline of the next live job, None if there is none
+        """
+
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+
+        return self._heap[0][0] if self._heap else None
+
+    def _pop(self, now):
+        """pop the next job due at now, rescheduling repeats
+
+            return None if nothing is due
+        """
+
+        deadline = self._top()
+        if deadline is None or deadline > now:
+            return None
+
+        _, _, job = heapq.heappop(self._heap)
+        if job.interval:
+            job.deadline += job.interval
+            if job.deadline <= now:
+                missed = (now - job.deadline) // job.interval + 1
+                job.deadline += missed * job.interval
+            self._push(job)
+        else:
+            job.cancelled = True
+
+        return job
+
+    def _next(self):
+        """wait for the next job that is due
+        """
+
+        with self._cv:
+            while self._running:
+                now = self.clock.monotonic_ns()
+                job = self._pop(now)
+                if job is not None:
+                    return job
+
+                deadline = self._top()
+                self._cv.wait(None if deadline is None else (deadline - now) / 1e9)
+
+            return None
+
+    def _call(self, job):
+        try:
+            job._f(*job._args)
+        except Exception:
+            traceback.print_exc()
+
+    def _run(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+
+            self._call(job)
+
+    def next_deadline(self):
+        """monotonic_ns() of the next job, None if there is none
+        """
+
+        with self._cv:
+            return self._top()
+
+    def run_due(self):
+        """run the jobs due now, for a virtual clock
+
+            return the number run
+        """
+
+        n = 0
+        while True:
+            with self._cv:
+                job = self._pop(self.clock.monotonic_ns())
+            if job is None:
+                return n
+
+            self._call(job)
+            n += 1
+
+    def _schedule(self, delay, interval, f, args):
+        job = Job(self, self.clock.monotonic_ns() + int(delay * 1e9), interval, f, args)
+
+        with self._cv:
+            self._push(job)
+            self._cv.notify()
+
+        return job
+
+    def every(self, interval, f, *args):
+        """call f(*args) every interval seconds
+        """
+
+        return self._schedule(interval, int(interval * 1e9), f, args)
+
+    def after(self, delay, f, *args):
+        """call f(*args) once, delay seconds from now
+        """
+
+        return self._schedule(delay, None, f, args)
+
+    def cancel(self, job):
+        """cancel a job, it is dropped when it reaches the top of the heap
+        """
+
+        with self._cv:
+            job.cancelled = True
+            self._cv.notify()
+
+    def stop(self):
+        """stop the scheduler thread
+        """
+
+        with self._cv:
+            self._running = False
+            self._cv.notify()
+
+    def __init__(self, clock=SYSTEM):
+        """create a scheduler, and start its thread unless
+           clock is virtual
+        """
+
+        self.clock = clock
+        self._heap = []
+        self._seq = 0
+        self._lock = Lock()
+        self._cv = Condition(self._lock)
+
+        self._running = True
+        if not clock.virtual:
+            self._thread = Thread(target=self._run, name='scheduler', daemon=True)
+            self._thread.start()
@@ -0,0 +1,245 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## shadow clock
+##
+###########
+"""Shadow the NCS31X RTC with the monotonic clock
+
+See module ncs31x for the RTC interface.
+
+The RTC is read once and wall time is then derived from
+the monotonic clock. The RTC is re-read every resync seconds
+to pull the shadow back into line, and the corrections are
+used to estimate how far the monotonic clock drifts from the
+RTC. The monotonic clock is injectable, see module clock.
+
+The RTC only reads out whole seconds, so the base is found
+by waiting for its seconds edge, which takes up to a second.
+That wait runs in a thread of its own, off the lock, and
+the shadow serves from the old base, or at startup from a
+whole second read, until the edge is found. On a virtual
+clock the wait costs nothing and runs inline. A caller that
+has just written the RTC knows what it reads and can rebase
+the shadow on it rather than invalidating it.
+
+Classes:
+
+    ShadowClock
+
+Functions:
+
+    drift()
+    invalidate()
+    now()
+    read(hour12)
+    rebase(rtc_sec, mono_ns)
+
+Misc variables:
+
+    _resync_ns
+    _drift
+"""
+
+from threading import Lock, Thread
+from time import localtime, mktime, struct_time
+
+from clock import SYSTEM
+
+class ShadowClock:
+    """shadow clock
+    """
+
+    VERSION = '0.0.1'
+
+    # seconds
+    _EDGE_POLL = 0.01
+    _EDGE_TIMEOUT = 1.1
+
+    _ncs31x = None
+    _clock = None
+    _lock = None
+
+    _resync_ns = None
+
+    # RTC epoch seconds at monotonic time _base_ns
+    _base_sec = None
+    _base_ns = None
+
+    # the base wants an edge search, one is running, and the
+    # base generation it started on
+    _stale = None
+    _searching = None
+    _generation = None
+
+    # drift estimate, seconds of correction since _first_ns
+    _first_ns = None
+    _correction = None
+    _drift = None
+
+    def _edge(self):
+        """wait for the RTC seconds to roll over
+
+            return the RTC epoch seconds just after the edge,
+            or None if the RTC never ticked
+        """
+
+        start = mktime(self._ncs31x.read_rtc(False))
+        for _ in range(int(self._EDGE_TIMEOUT / self._EDGE_POLL)):
+            self._clock.sleep(self._EDGE_POLL)
+            now = mktime(self._ncs31x.read_rtc(False))
+            if now != start:
+                return now
+
+        return None
+
+    def _search(self, generation):
+        """find the RTC seconds edge and base the shadow on it
+
+            runs off the lock. the result is dropped if the base
+            was set meanwhile, it may straddle an RTC write
+        """
+
+        rtc = self._edge()
+        ns = self._clock.monotonic_ns()
+
+        with self._lock:
+            self._searching = False
+            if generation != self._generation:
+                return
+
+            # an RTC that never ticked keeps the whole second base
+            if rtc is not None:
+                self._base_sec = rtc
+                self._base_ns = ns
+
+            self._stale = False
+            self._first_ns = self._base_ns
+            self._correction = 0.0
+
+    def _sync(self):
+        """re-read the RTC and correct the shadow
+        """
+
+        rtc = mktime(self._ncs31x.read_rtc(False))
+        ns = self._clock.monotonic_ns()
+
+        # the RTC only resolves whole seconds, so the true time is
+        # somewhere in [rtc, rtc + 1). only correct the shadow when
+        # it has wandered out of that second.
+        predicted = self._base_sec + (ns - self._base_ns) / 1e9
+        corrected = min(max(predicted, rtc), rtc + 1 - self._EDGE_POLL)
+
+        self._correction += corrected - predicted
+        self._base_sec = corrected
+        self._base_ns = ns
+
+        elapsed = (ns - self._first_ns) / 1e9
+        if elapsed:
+            self._drift = self._correction / elapsed * 1e6
+
+    def now(self):
+        """current RTC time in epoch seconds
+        """
+
+        with self._lock:
+            if self._base_ns is None:
+                # a whole second, until the edge is found
+                self._base_sec = mktime(self._ncs31x.read_rtc(False))
+                self._base_ns = self._clock.monotonic_ns()
+                self._first_ns = self._base_ns
+                self._correction = 0.0
+
+            search = self._stale and not self._searching
+            if search:
+                self._searching = True
+                generation = self._generation
+            elif self._clock.monotonic_ns() - self._base_ns >= self._resync_ns:
+                self._sync()
+
+        if search:
+            if self._clock.virtual:
+                self._search(generation)
+            else:
+                Thread(target=self._search, args=(generation,),
+                       name='rtc-edge', daemon=True).start()
+
+        with self._lock:
+            return self._base_sec + (self._clock.monotonic_ns() - self._base_ns) / 1e9
+
+    def read(self, hour12):
+        """read the shadow clock
+            return a struct_time()
+        """
+
+        tm = localtime(self.now())
+        if hour12 and tm.tm_hour > 12:
+            return struct_time((tm.tm_year,
+                                tm.tm_mon,
+                                tm.tm_mday,
+                                tm.tm_hour - 12,
+                                tm.tm_min,
+                                tm.tm_sec,
+                                tm.tm_wday,
+                                tm.tm_yday,
+                                tm.tm_isdst))
+
+        return tm
+
+    def drift(self):
+        """estimated drift of the monotonic clock against the RTC in ppm,
+           None until the first resync
+        """
+
+        return self._drift
+
+    def invalidate(self):
+        """find the RTC seconds edge again from the next read on, eg.
+           after the RTC is written to an unknown phase
+        """
+
+        with self._lock:
+            self._stale = True
+            self._generation += 1
+            self._drift = None
+
+    def rebase(self, rtc_sec, mono_ns=None):
+        """the RTC read rtc_sec at monotonic time mono_ns, default
+           now, eg. just after writing it: base the shadow there
+           without searching for the edge
+        """
+
+        if mono_ns is None:
+            mono_ns = self._clock.monotonic_ns()
+
+        with self._lock:
+            self._base_sec = rtc_sec
+            self._base_ns = mono_ns
+            if self._first_ns is None:
+                self._first_ns = mono_ns
+                self._correction = 0.0
+            self._stale = False
+            self._generation += 1
+
+    def __init__(self, ncs31x, resync, clock=SYSTEM):
+        """create a shadow clock
+
+            resync: seconds between RTC reads
+            clock: the monotonic time source
+        """
+
+        self._ncs31x = ncs31x
+        self._clock = clock
+        self._lock = Lock()
+        self._resync_ns = int(resync * 1e9)
+
+        self._stale = True
+        self._searching = False
+        self._generation = 0
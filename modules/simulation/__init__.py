@@ -0,0 +1,228 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## simulation
+##
+###########
+"""Run the clock on virtual time
+
+See module clock for virtual time, module pigsim for the
+simulated board.
+
+A Simulation builds the display stack the way Retro does,
+on a VirtualClock and a pigsim board that takes no
+scripts, so the backlight and animations run from the
+scheduler and the player rather than from daemon threads.
+run() then jumps the clock from one timer deadline to the
+next and handles every event on the spot, so time costs
+only the CPU it takes to handle what happens in it: a day
+of ticks is 86400 trips round the event loop, not 86400
+seconds.
+
+Presses, releases and configuration changes are scheduled
+on the same virtual timeline. A check function sees every
+event handled, with the state before and after, and can
+assert on the state, the digits and the frames written.
+
+Classes:
+
+    Simulation
+
+Functions:
+
+    at(seconds, f, *args)
+    configure(changes)
+    digits()
+    frame()
+    now()
+    press(pin, duration)
+    run(seconds, check)
+    state()
+
+Misc variables:
+
+    busy
+    clock
+    display
+    gra_afch
+    handled
+    pi
+    transitions
+    written
+"""
+
+from itertools import islice
+from time import localtime
+
+from clock import VirtualClock
+from config import Config
+from display import Display
+from event import Event
+from gra_afch import GraAfch
+from pigsim import Pi
+from scheduler import Scheduler
+
+class Simulation:
+    """the clock on virtual time
+    """
+
+    VERSION = '0.0.1'
+
+    clock = None
+    config = None
+    pi = None
+    event = None
+    scheduler = None
+    gra_afch = None
+    display = None
+
+    # events handled, (before, event, after): count
+    handled = None
+    transitions = None
+
+    # virtual seconds the last event took to handle, and the
+    # frames it wrote
+    busy = None
+    written = None
+
+    def at(self, seconds, f, *args):
+        """call f(*args) seconds from now, virtual
+        """
+
+        return self.scheduler.after(seconds, f, *args)
+
+    def _edge(self, pin, level, ns):
+        self.pi.set_level(pin, level, (ns // 1000) & 0xffffffff)
+
+    def press(self, pin, duration=0.05, delay=0):
+        """press a button delay seconds from now, for duration seconds
+
+            like pigpiod, the edges arrive once they have held
+            steady for the glitch filter time, stamped with the
+            daemon tick steady microseconds after the edge, even
+            if a handler was busy
+        """
+
+        steady = self.config.button_glitch / 1e6
+        if duration < steady:
+            return
+
+        down = self.clock.monotonic_ns() + int((delay + steady) * 1e9)
+        up = down + int(duration * 1e9)
+        self.at(delay + steady, self._edge, pin, 0, down)
+        self.at(delay + steady + duration, self._edge, pin, 1, up)
+
+    def configure(self, changes):
+        """apply retro.json changes, eg. {'blank-timeout': 30}, the way
+           a reloaded file is applied
+
+            return the fields that changed
+        """
+
+        conf_dict = {key: getattr(self.config, field) for key, field in Config._KEYS.items()}
+        conf_dict.update(changes)
+
+        config = Config.__new__(Config)
+        config.compile(conf_dict)
+
+        changed = self.config.update(config)
+        if changed:
+            self.display.configure(changed)
+
+        return changed
+
+    def now(self):
+        """virtual local time
+        """
+
+        return localtime(self.clock.time())
+
+    def state(self):
+        """the display state name
+        """
+
+        return Display.STATES[self.display._state]
+
+    def digits(self):
+        """the digits of the last time shown
+        """
+
+        return self.gra_afch._digits
+
+    def frame(self):
+        """the last frame written to the board, or None
+        """
+
+        return self.pi.frames[-1][1] if self.pi.frames else None
+
+    def _drain(self, check):
+        while True:
+            ev = self.event.poll()
+            if ev is None:
+                return
+
+            before = self.display._state
+            began = self.clock.monotonic_ns()
+            writes = self.pi.writes
+            self.display.state_machine(ev)
+            self.busy = (self.clock.monotonic_ns() - began) / 1e9
+            writes = min(self.pi.writes - writes, len(self.pi.frames))
+            self.written = [frame for _, frame in islice(reversed(self.pi.frames), writes)][::-1]
+            after = self.display._state
+
+            self.handled += 1
+            key = (Display.STATES[before], self.event.name(ev.type), Display.STATES[after])
+            self.transitions[key] = self.transitions.get(key, 0) + 1
+
+            if check is not None:
+                check(self, ev, key[0], key[2])
+
+    def run(self, seconds, check=None):
+        """run seconds of virtual time as fast as it will go
+
+            check: called as check(simulation, event, before, after)
+                   after every event handled, an exception ends the run
+        """
+
+        end = self.clock.monotonic_ns() + int(seconds * 1e9)
+        while True:
+            self._drain(check)
+
+            deadline = self.scheduler.next_deadline()
+            if deadline is None or deadline > end:
+                break
+
+            self.clock.advance_to(deadline)
+            self.scheduler.run_due()
+
+        self.clock.advance_to(end)
+        self._drain(check)
+
+    def __init__(self, config, start=None, hv5222=False, drift=0.0):
+        """config: see module config, the simulation changes it
+           start: virtual epoch seconds to start at, default now
+           hv5222: simulate an HV5222 board
+           drift: RTC drift in ppm
+        """
+
+        self.config = config
+        self.clock = VirtualClock(start)
+        self.pi = Pi(hv5222=hv5222, clock=self.clock, drift=drift, scripts=False)
+        self.event = Event()
+        self.scheduler = Scheduler(self.clock)
+        self.gra_afch = GraAfch(config, self.event, self.scheduler, self.pi)
+        self.display = Display(self.gra_afch, self.event, self.scheduler)
+
+        self.handled = 0
+        self.transitions = {}
+        self.busy = 0.0
+        self.written = []
+
+        self.display.unblank_display()
@@ -0,0 +1,133 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## startup
+##
+###########
+"""Readiness-driven startup
+
+Rather than sleeping a fixed time and hoping pigpiod and
+the board are up, probe them: connect to pigpiod with
+backoff, then wait for the board to answer on I2C before
+anything touches it. Once the clock is running, tell
+systemd (Type=notify services) through $NOTIFY_SOCKET.
+
+Functions:
+
+    board(gpio, timeout)
+    connect(host, port, timeout)
+    notify(**state)
+    wait(probe, timeout)
+
+Misc variables:
+
+    BACKOFF
+"""
+
+import os
+import socket
+
+from time import monotonic, sleep
+
+import pigpio
+
+from ncs31x import Ncs31x
+
+VERSION = '0.0.1'
+
+# seconds, first retry and the most we wait between retries
+BACKOFF = (0.02, 0.5)
+
+def wait(probe, timeout):
+    """call probe() with exponential backoff until it returns
+       something true or timeout seconds have passed
+
+        return what probe() returned last
+    """
+
+    deadline = monotonic() + timeout
+    delay, most = BACKOFF
+    while True:
+        result = probe()
+        if result or monotonic() >= deadline:
+            return result
+
+        sleep(min(delay, max(0, deadline - monotonic())))
+        delay = min(delay * 2, most)
+
+def connect(host=None, port=None, timeout=30):
+    """connect to pigpiod, retrying while it starts
+
+        return a connected pigpio.pi, raise ConnectionError if
+        the daemon never answers
+    """
+
+    host = host or os.getenv('PIGPIO_ADDR', 'localhost')
+    port = port or os.getenv('PIGPIO_PORT', 8888)
+
+    def probe_():
+        gpio = pigpio.pi(host, port, show_errors=False)
+        if gpio.connected:
+            return gpio
+
+        gpio.stop()
+        return None
+
+    gpio = wait(probe_, timeout)
+    if gpio is None:
+        raise ConnectionError('no pigpiod at {}:{}'.format(host, port))
+
+    return gpio
+
+def board(gpio, timeout=30):
+    """wait for the board behind a connected pigpio.pi to answer
+
+        return False if it doesn't within timeout seconds
+    """
+
+    # bare handles, an Ncs31x would set the whole board up only
+    # for GraAfch to do it again
+    def probe_():
+        try:
+            i2c = gpio.i2c_open(1, Ncs31x.I2C_ADDRESS)
+            try:
+                count, _ = gpio.i2c_read_i2c_block_data(i2c,
+                                                        Ncs31x._SECOND_REGISTER,
+                                                        Ncs31x._RTC_REGISTERS)
+            finally:
+                gpio.i2c_close(i2c)
+
+            gpio.spi_close(gpio.spi_open(0, 2000000, 2))
+        except pigpio.error:
+            return False
+
+        return count == Ncs31x._RTC_REGISTERS
+
+    return wait(probe_, timeout)
+
+def notify(**state):
+    """send state to systemd, eg. notify(READY=1, STATUS='running')
+
+        return False when not run by systemd
+    """
+
+    address = os.getenv('NOTIFY_SOCKET')
+    if not address:
+        return False
+
+    if address.startswith('@'):
+        address = '\0' + address[1:]
+
+    message = '\n'.join('{}={}'.format(key, val) for key, val in state.items())
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.connect(address)
+        sock.sendall(message.encode())
+
+    return True
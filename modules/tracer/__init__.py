@@ -0,0 +1,223 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## event trace
+##
+###########
+"""Always-on trace of the display state machine
+
+Every event the state machine handles is recorded in a
+fixed-size ring: when it was handled, its type and
+argument, the state before and after, and the frame on the
+tubes afterwards. The ring is a set of preallocated arrays,
+so recording is four stores and nothing is allocated:
+type and states are packed into one 16 bit word, and the
+argument and frame are kept by reference until a dump packs
+them. GraAfch never changes a frame in place, it makes a
+new one.
+
+A dump is a small header, then the fields column by
+column, oldest record first:
+
+    magic, version, records, hv5222, the display's
+    clock in epoch ns and monotonic_ns() at the dump,
+    length of the names json: "<4sHI?qqI"
+    names json: {"events": [...], "states": [...]}
+    stamps:  records int64, monotonic_ns() handled
+    types:   records uint8
+    states:  records uint8, before << 4 | after
+    args:    records int64, see _ARGS
+    frames:  records * 8 bytes
+
+See retro-lib/replay.py to feed a dump back through the
+display.
+
+Classes:
+
+    Trace
+
+Functions:
+
+    dump(file, now)
+    dumps(now)
+    load(file)
+    record(stamp, type_, before, after, arg, frame)
+
+Misc variables:
+
+    _ARGS
+    MAGIC
+"""
+
+import json
+import struct
+
+from array import array
+
+from clock import SYSTEM
+
+VERSION = '0.0.1'
+
+MAGIC = b'RTRC'
+
+_HEADER = struct.Struct('<4sHI?qqI')
+
+# event arguments that aren't counts, stored as -1 - index,
+# anything else is dumped as None
+_ARGS = (None, 'down', 'repeat')
+
+def _arg(arg):
+    if type(arg) is int:
+        return arg
+
+    return -1 - _ARGS.index(arg) if arg in _ARGS else -1
+
+def load(file):
+    """read a dump
+
+        return a dictionary of the header fields, the names,
+        and a list of records (stamp, type, before, after,
+        arg, frame), oldest first
+    """
+
+    data = file.read()
+    magic, version, n, hv5222, wall, mono, length = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != 1:
+        raise ValueError('not a retro trace')
+
+    offset = _HEADER.size
+    names = json.loads(data[offset:offset + length])
+    offset += length
+
+    def column_(typecode, size):
+        nonlocal offset
+        column = array(typecode)
+        column.frombytes(data[offset:offset + n * size])
+        offset += n * size
+        return column
+
+    stamps = column_('q', 8)
+    types = data[offset:offset + n]
+    offset += n
+    states = data[offset:offset + n]
+    offset += n
+    args = column_('q', 8)
+    frames = data[offset:offset + n * 8]
+
+    return {
+        'hv5222': hv5222,
+        'wall': wall,
+        'monotonic': mono,
+        'events': names['events'],
+        'states': names['states'],
+        'records': [(stamps[i],
+                     types[i],
+                     states[i] >> 4,
+                     states[i] & 0xf,
+                     _ARGS[-1 - args[i]] if args[i] < 0 else args[i],
+                     bytes(frames[i * 8:i * 8 + 8]))
+                    for i in range(n)],
+    }
+
+class Trace:
+    """the trace ring
+    """
+
+    VERSION = '0.0.1'
+
+    _size = None
+    _mask = None
+    _n = None
+
+    _stamps = None
+    _kinds = None
+    _args = None
+    _frames = None
+
+    _names = None
+    _hv5222 = None
+    _clock = None
+
+    def record(self, stamp, type_, before, after, arg, frame):
+        """record an event, frame is the packed frame on the tubes or None
+        """
+
+        i = self._n & self._mask
+        self._n += 1
+
+        self._stamps[i] = stamp
+        self._kinds[i] = type_ << 8 | before << 4 | after
+        self._args[i] = arg
+        self._frames[i] = frame
+
+    def _order(self):
+        """ring indices, oldest first
+        """
+
+        n = min(self._n, self._size)
+        start = (self._n - n) & self._mask
+
+        return [(start + i) & self._mask for i in range(n)]
+
+    def dumps(self, now=None):
+        """the trace as bytes
+
+            now: the display's clock in epoch seconds, so stamps
+                 map to the time the tubes showed, default the
+                 clock's time()
+        """
+
+        mono = self._clock.monotonic_ns()
+        wall = int((now if now is not None else self._clock.time()) * 1e9)
+
+        order = self._order()
+        names = json.dumps(self._names).encode()
+
+        stamps = array('q', (self._stamps[i] for i in order))
+        args = array('q', (_arg(self._args[i]) for i in order))
+
+        return b''.join([
+            _HEADER.pack(MAGIC, 1, len(order), self._hv5222, wall, mono, len(names)),
+            names,
+            stamps.tobytes(),
+            bytes(self._kinds[i] >> 8 for i in order),
+            bytes(self._kinds[i] & 0xff for i in order),
+            args.tobytes(),
+            b''.join(bytes(self._frames[i] or bytes(8)) for i in order),
+        ])
+
+    def dump(self, file, now=None):
+        """write the trace to a binary file, see dumps()
+        """
+
+        file.write(self.dumps(now))
+
+    def __len__(self):
+        return min(self._n, self._size)
+
+    def __init__(self, event_names, state_names, hv5222, size=4096, clock=SYSTEM):
+        """event_names, state_names: for the dump
+           hv5222: the board's frame packing
+           size: records kept, rounded up to a power of two
+           clock: the record stamps' time source, see module clock
+        """
+
+        self._size = 1 << max(0, size - 1).bit_length()
+        self._mask = self._size - 1
+        self._n = 0
+
+        self._stamps = array('q', bytes(8 * self._size))
+        self._kinds = array('H', bytes(2 * self._size))
+        self._args = [None for _ in range(self._size)]
+        self._frames = [None for _ in range(self._size)]
+
+        self._names = {'events': list(event_names), 'states': list(state_names)}
+        self._hv5222 = hv5222
+        self._clock = clock
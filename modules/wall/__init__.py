@@ -0,0 +1,274 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## clock wall
+##
+###########
+"""Drive a wall of NCS31X clocks from one controller
+
+See module ncs31x for the board interface, module encoder
+for frame packing.
+
+Every board is a pigpiod connection, local or remote. A
+frame is encoded once per distinct packing (HV5122 or
+HV5222), not once per board, and boards already showing it
+are skipped, so the work per second grows with the number
+of distinct frames rather than the number of boards.
+
+Updates go out in two phases over a thread pool: every
+board shifts the frame in over SPI with LE held low, so its
+tubes keep the last frame, then every board strobes LE
+high to latch it. The strobe is one short command, so the
+tubes flip within a round trip of each other however long
+the SPI writes took. Each board keeps SPI and latch latency
+histograms, and the wall keeps the spread of the strobes.
+
+The time digits are formatted the way GraAfch formats them.
+
+Classes:
+
+    Board
+    Wall
+
+Functions:
+
+    latch()
+    push(digits)
+    report()
+    run()
+    show_time()
+    showing(frame)
+    stop()
+    write(frame)
+
+Misc variables:
+
+    _boards
+    _pool
+"""
+
+import pigpio
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import localtime, monotonic_ns, time
+
+from encoder import Encoder
+from gra_afch import GraAfch
+from latency import Histogram
+from ncs31x import Ncs31x
+
+class Board:
+    """one clock on the wall
+    """
+
+    VERSION = '0.0.1'
+
+    name = None
+    ncs31x = None
+    encoder = None
+
+    # frames are shared by boards with the same key
+    key = None
+
+    _frame = None
+    _errors = None
+
+    _spi = None
+    _latch = None
+
+    def write(self, frame):
+        """shift a frame in behind the tubes, LE low, return False if
+           the board didn't take it
+        """
+
+        start = monotonic_ns()
+        try:
+            self.ncs31x.write_frame(frame)
+        except (pigpio.error, OSError):
+            self._errors += 1
+            self._frame = None
+            return False
+
+        self._frame = frame
+        self._spi.record(monotonic_ns() - start, monotonic_ns())
+
+        return True
+
+    def latch(self):
+        """strobe LE high to latch the shifted frame into the tubes
+
+            return monotonic_ns() when the board acknowledged
+        """
+
+        start = monotonic_ns()
+        try:
+            self.ncs31x.latch()
+        except (pigpio.error, OSError):
+            self._errors += 1
+            self._frame = None
+            return None
+
+        done = monotonic_ns()
+        self._latch.record(done - start, done)
+
+        return done
+
+    def showing(self, frame):
+        """is the board already showing frame
+        """
+
+        return self._frame == frame
+
+    def report(self):
+        """nanosecond SPI and latch latency, and errors
+        """
+
+        return {
+            'spi': self._spi.report(),
+            'latch': self._latch.report(),
+            'errors': self._errors,
+        }
+
+    def __init__(self, name, gpio, dots=True, tube_mask=None, window=60):
+        """name: for reports, eg. host:port
+           gpio: a connected pigpio.pi for the board
+        """
+
+        self.name = name
+        self.ncs31x = Ncs31x(gpio)
+        self.encoder = Encoder(self.ncs31x, dots,
+                               tube_mask if tube_mask is not None else [255 for _ in range(8)])
+        self.key = self.ncs31x._hv5222
+
+        self._errors = 0
+        self._spi = Histogram(window)
+        self._latch = Histogram(window)
+
+        # clear() leaves LE low, frames are shifted in behind
+        # the tubes until the latch
+        self.ncs31x.clear()
+
+class Wall:
+    """the clock wall
+    """
+
+    VERSION = '0.0.1'
+
+    _boards = None
+    _pool = None
+    _scheduler = None
+    _config = None
+    _job = None
+    _lock = None
+    _stopped = None
+
+    _skew = None
+
+    def _render(self, digits):
+        """one frame per distinct board packing
+        """
+
+        frames = {}
+        for board in self._boards:
+            if board.key not in frames:
+                frames[board.key] = bytes(board.encoder.encode(digits))
+
+        return frames
+
+    def push(self, digits):
+        """put digits on every board
+
+            return the number of boards updated
+        """
+
+        frames = self._render(digits)
+        boards = [board for board in self._boards if not board.showing(frames[board.key])]
+        if not boards:
+            return 0
+
+        written = list(self._pool.map(lambda board: board.write(frames[board.key]), boards))
+        boards = [board for board, ok in zip(boards, written) if ok]
+
+        done = [ns for ns in self._pool.map(Board.latch, boards) if ns is not None]
+        if len(done) > 1:
+            self._skew.record(max(done) - min(done), monotonic_ns())
+
+        return len(done)
+
+    def show_time(self):
+        """the controller's time on every board, the boards'
+           RTCs are not read
+        """
+
+        digits = GraAfch.time_digits(localtime(),
+                                     self._config.hour12,
+                                     self._config.zero_blank)
+
+        self.push(digits)
+
+    def _second(self):
+        """show the time and rearm on the next second boundary, so
+           the wall follows the wall clock through NTP slews
+        """
+
+        with self._lock:
+            if self._stopped:
+                return
+
+            self.show_time()
+            self._job = self._scheduler.after(1 - time() % 1, self._second)
+
+    def run(self):
+        """update the wall on every wall-clock second
+        """
+
+        self._job = self._scheduler.after(1 - time() % 1, self._second)
+
+    def stop(self):
+        """stop updating, and let go of the boards
+        """
+
+        with self._lock:
+            self._stopped = True
+            if self._job is not None:
+                self._job.cancel()
+
+        self._pool.shutdown()
+        for board in self._boards:
+            try:
+                board.ncs31x.close()
+            except Exception:
+                traceback.print_exc()
+
+    def report(self):
+        """per board latency, and the spread of the LE strobes
+        """
+
+        return {
+            'boards': {board.name: board.report() for board in self._boards},
+            'skew': self._skew.report(),
+        }
+
+    def __init__(self, config, scheduler, boards, workers=None, window=60):
+        """config: see module config
+           boards: Board objects
+           workers: threads pushing updates, default one per board
+        """
+
+        self._config = config
+        self._scheduler = scheduler
+        self._boards = list(boards)
+        self._pool = ThreadPoolExecutor(max_workers=workers or len(self._boards),
+                                        thread_name_prefix='wall')
+        self._skew = Histogram(window)
+        self._lock = Lock()
+        self._stopped = False
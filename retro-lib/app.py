@@ -1,32 +1,54 @@
 import time
 import os
+import sys
 import json
+import logging
 
-from datetime import datetime
+# run from the tree without PYTHONPATH
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'modules'))
 
-from bottle import template, route, run, static_file
+from datetime import datetime
 from threading import Thread
 
+import startup
+
+from config import Config
 from retro import Retro
-from event import Event
 
-import jyserver.Bottle as js
+# bring the clock up first, the web stack can wait
+config = Config(os.path.join(os.path.dirname(__file__), '../etc/retro.json'))
 
-up_since = datetime.now()
+gpio = startup.connect()
+if not startup.board(gpio):
+    print('the board is not answering, starting anyway')
 
-conf_dict = []
-with open(os.path.join(os.path.dirname(__file__), '../etc/retro.json'), 'r') as file:
-    conf_dict = json.load(file)
+retro = Retro(config, gpio)
+retro.watch()
+retro.control()
+retro.start()
 
-retro = Retro(conf_dict)
+event_thread = Thread(group=None, target=retro.run, name=None, args=(), kwargs={})
+event_thread.start()
+
+from bottle import route, run, request, response, abort, HTTPResponse
+
+from broadcast import Broadcaster
+from assets import Assets
+from httpd import PoolServer
+
+import jyserver.Bottle as js
+import jyserver.jscript
 
-event_thread = Thread(group=None, target=retro.display.event_loop, name=None, args=(), kwargs={})
+broadcaster = Broadcaster(retro.scheduler, retro.status)
+
+assets = Assets(os.path.join(os.path.dirname(__file__), '../static'))
+assets.add('jyserver.js', jyserver.jscript.JSCRIPT, 'application/javascript')
 
 @js.use
 class App():
     # buttons
     def configure(self):
-        print("configure me")
+        retro.configure()
     def reset(self):
         print("reset me")
     def clean(self):
@@ -38,35 +60,57 @@ class App():
     def reboot(self):
         os.system("sudo reboot"); 
 
-    @js.task
-    def update_clock(self, retro):
-        while True:
-            self.js.dom.version.innerHTML = retro.version()
-            self.js.dom.up_time.innerHTML = up_since.strftime('%m/%d/%Y %H:%M:%S')
-            self.js.dom.display_time.innerHTML = retro.display.time().strftime('%m/%d/%Y %H:%M:%S')
-            self.js.dom.system_time.innerHTML = datetime.now().strftime('%m/%d/%Y %H:%M:%S')
-            time.sleep(1)
-
+@route('/status')
+def status():
+    response.content_type = 'text/event-stream'
+    response.set_header('Cache-Control', 'no-cache')
+    return broadcaster.stream()
+
+@route('/trace')
+def trace():
+    response.content_type = 'application/octet-stream'
+    response.set_header('Content-Disposition', 'attachment; filename="retro.trace"')
+    response.set_header('Cache-Control', 'no-cache')
+    return retro.display.trace()
+
+def serve(path):
+    reply = assets.serve(path,
+                         request.headers.get('If-None-Match'),
+                         request.headers.get('Accept-Encoding', ''))
+    if reply is None:
+        abort(404)
+
+    status, headers, body = reply
+    return HTTPResponse(body, status, headers)
+
+# the page shell is rendered from memory, jyserver only adds
+# its page ids, the script itself is served as an asset
 @route('/')
 def static():
-    with open('/home/putnamjm/retro/static/html/index.html') as f: html = f.read()
-    
-    App.update_clock(retro)
-    return App.render(html)
-    # return static_file('html/index.html', root='/home/putnamjm/retro/static', mimetype='text/html')
+    response.set_header('Cache-Control', 'no-cache')
+    return App.render(assets.body('html/index.html'))
+
+@route('/jyserver.js')
+def static():
+    return serve('jyserver.js')
 
 @route('/<dir>/<file>')
 def static(dir, file):
-    return static_file(os.path.join(dir, file), root='/home/putnamjm/retro/static')
+    return serve(dir + '/' + file)
 
 @route('/static/<dir>/<file>')
 def static(dir, file):
-    return static_file(os.path.join(dir, file), root='/home/putnamjm/retro/static')
-
-# inhale deeply
-time.sleep(4)
-retro.display.unblank_display()
-
-event_thread.start()
-
-run(host='retro', port=8080, debug=False, quiet=True)
+    return serve(dir + '/' + file)
+
+if config.http_log:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+
+run(server=PoolServer,
+    host=config.http_host,
+    port=config.http_port,
+    workers=config.http_workers,
+    keep_alive=config.http_keep_alive,
+    log=config.http_log,
+    streams=('/status', '/_process_srv0'),
+    debug=False,
+    quiet=True)
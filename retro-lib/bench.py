@@ -0,0 +1,155 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## hardware path benchmarks
+##
+###########
+"""benchmark the hardware path against the pigpiod stand-in
+
+    rtc:      cost and round trips of an RTC read, raw and shadowed
+    frames:   display_numerals frames per second and round trips per frame
+    ticks:    tick-to-SPI latency and round trips per tick, in real time
+    presses:  button edge to state machine, with the event loop running
+    sweep:    cathode cleaning frame rate and lateness, with the event loop running
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from threading import Thread
+from time import monotonic_ns, perf_counter
+
+# run from the tree without PYTHONPATH
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'modules'))
+
+from config import Config
+from ncs31x import Ncs31x
+from pigsim import Pi
+from retro import Retro
+
+VERSION = '0.0.1'
+
+def _per_call(f, count):
+    start = perf_counter()
+    for _ in range(count):
+        f()
+
+    return (perf_counter() - start) / count
+
+def rtc(retro, pi, count):
+    ncs31x = retro.gra_afch._ncs31x
+    clock = retro.gra_afch._clock
+
+    calls = pi.calls
+    raw = _per_call(lambda: ncs31x.read_rtc(False), count)
+    raw_trips = (pi.calls - calls) / count
+
+    # the first read locks onto the RTC seconds edge
+    clock.now()
+
+    calls = pi.calls
+    shadow = _per_call(lambda: clock.read(False), count)
+    shadow_trips = (pi.calls - calls) / count
+
+    print('rtc read         {:10.2f} us  {:6.2f} round trips'.format(raw * 1e6, raw_trips))
+    print('shadow read      {:10.2f} us  {:6.2f} round trips'.format(shadow * 1e6, shadow_trips))
+
+def frames(retro, pi, count):
+    gra_afch = retro.gra_afch
+    digits = [[n, n, n, n, n, n, 8, 8] for n in (1, 2)]
+
+    # a blanked board isn't latched
+    gra_afch._ncs31x.unblank()
+
+    calls = pi.calls
+    per_frame = _per_call(lambda: [gra_afch.display_numerals(d) for d in digits], count) / 2
+    trips = (pi.calls - calls) / (2 * count)
+
+    same = _per_call(lambda: gra_afch.display_numerals(digits[0]), count)
+
+    print('display_numerals {:10.0f} fps {:6.2f} round trips'.format(1 / per_frame, trips))
+    print('unchanged frame  {:10.0f} fps'.format(1 / same))
+
+def ticks(retro, pi, seconds):
+    display = retro.display
+    sent = []
+
+    def tick_():
+        sent.append((monotonic_ns(), pi.calls))
+        retro.event.send(display._tick_event)
+
+    display._sec_timer.cancel()
+    retro.scheduler.every(1, tick_)
+
+    Thread(target=retro.run, daemon=True).start()
+    time.sleep(seconds + 0.5)
+
+    frames_ = list(pi.frames)
+    latency = []
+    for stamp, _ in sent:
+        after = [ns for ns, _ in frames_ if ns >= stamp]
+        if after:
+            latency.append((after[0] - stamp) / 1e3)
+
+    trips = (pi.calls - sent[0][1]) / len(sent) if sent else 0
+
+    if latency:
+        latency.sort()
+        print('tick to SPI      {:10.2f} us p50 {:10.2f} us max'.format(
+            latency[len(latency) // 2], latency[-1]))
+    print('ticks            {:10d}     {:6.2f} round trips'.format(len(sent), trips))
+
+def presses(retro, pi, count):
+    for _ in range(count):
+        pi.press(Ncs31x.UP_BUTTON_PIN, 0.02)
+        time.sleep(0.03)
+
+    press = retro.display.latency()['input'].get('up-button')
+    if press:
+        print('press to display {:10.2f} us p50 {:10.2f} us max'.format(
+            press['p50'] / 1e3, press['max'] / 1e3))
+
+def sweep(retro, pi):
+    retro.display.clean_display()
+    time.sleep(0.1)
+    while retro.gra_afch._player.busy():
+        time.sleep(0.1)
+
+    player = retro.display.latency()['player']
+    late = player['late'] or {'p50': 0, 'max': 0}
+    print('sweep            {:10.0f} fps {:10.2f} us p50 {:10.2f} us max late'.format(
+        player['fps'], late['p50'] / 1e3, late['max'] / 1e3))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='retro hardware path benchmarks')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='emulated pigpiod round trip in microseconds')
+    parser.add_argument('--count', type=int, default=10000,
+                        help='iterations for the rtc and frame benchmarks')
+    parser.add_argument('--seconds', type=int, default=5,
+                        help='real time spent in the tick benchmark')
+    parser.add_argument('--presses', type=int, default=20,
+                        help='button presses in the press benchmark')
+    parser.add_argument('--hv5222', action='store_true',
+                        help='emulate an HV5222 board')
+    args = parser.parse_args()
+
+    config = Config(os.path.join(os.path.dirname(__file__), '../etc/retro.json'))
+
+    pi = Pi(latency=args.latency / 1e6, hv5222=args.hv5222)
+    retro = Retro(config, pi)
+
+    rtc(retro, pi, args.count)
+    frames(retro, pi, args.count)
+    ticks(retro, pi, args.seconds)
+    presses(retro, pi, args.presses)
+    sweep(retro, pi)
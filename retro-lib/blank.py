@@ -12,12 +12,29 @@
 ##
 ###########
 """blank the display
+
+    ask the running clock over its control socket, so the live
+    display state is left alone. with no clock running, drive
+    the board directly.
 """
 
+import os
+import sys
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'modules'))
+
+from config import Config
+from control import request
 from ncs31x import Ncs31x
 
-VERSION = '0.0.1'
+VERSION = '0.0.2'
 
 if __name__ == '__main__':
-    ncs31x = Ncs31x()
-    ncs31x.blank()
+    config = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etc', 'retro.json'))
+    try:
+        reply = request(config.control_socket, 'blank')
+        if not reply['ok']:
+            sys.exit(reply['error'])
+    except OSError:
+        with Ncs31x() as ncs31x:
+            ncs31x.blank()
@@ -0,0 +1,110 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## clock wall
+##
+###########
+"""drive a wall of clocks from this controller
+
+    python3 clockwall.py --board pi1 --board pi2:8888 [config]
+    python3 clockwall.py --sim 16 --latency 500 --seconds 10
+
+    each board runs pigpiod only, not retro.py. with --sim
+    the boards are in-process pigpiod stand-ins. with
+    --seconds, run that long and print the latency report,
+    otherwise run until interrupted.
+"""
+
+import argparse
+import os
+import signal
+import sys
+import time
+
+# run from the tree without PYTHONPATH
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'modules'))
+
+import startup
+
+from config import Config
+from scheduler import Scheduler
+from wall import Board, Wall
+
+VERSION = '0.0.1'
+
+def _boards(args, config):
+    """connect to the boards
+    """
+
+    if args.sim:
+        from pigsim import Pi
+
+        return [Board('sim{}'.format(n), Pi(latency=args.latency / 1e6), config.dots)
+                for n in range(args.sim)]
+
+    boards = []
+    for board in args.board:
+        host, _, port = board.partition(':')
+        boards.append(Board(board, startup.connect(host, int(port) if port else None), config.dots))
+
+    return boards
+
+def _print(report):
+    def ms_(histogram):
+        if not histogram:
+            return '{:>8} {:>8} {:>8}'.format('-', '-', '-')
+
+        return '{:8.2f} {:8.2f} {:8.2f}'.format(histogram['p50'] / 1e6,
+                                               histogram['p99'] / 1e6,
+                                               histogram['max'] / 1e6)
+
+    print('{:16} {:>26} {:>26} {:>6}'.format('board', 'spi p50/p99/max ms', 'latch p50/p99/max ms', 'errors'))
+    for name, board in report['boards'].items():
+        print('{:16} {} {} {:6d}'.format(name, ms_(board['spi']), ms_(board['latch']), board['errors']))
+    print('{:16} {:>26} {}'.format('latch skew', '', ms_(report['skew'])))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='retro clock wall')
+    parser.add_argument('config', nargs='?',
+                        default=os.path.join(os.path.dirname(__file__), '../etc/retro.json'))
+    parser.add_argument('--board', action='append', default=[],
+                        help='host[:port] of a board\'s pigpiod, repeatable')
+    parser.add_argument('--sim', type=int, default=0,
+                        help='drive this many pigpiod stand-ins instead')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='emulated stand-in round trip in microseconds')
+    parser.add_argument('--seconds', type=int, default=0,
+                        help='run this long and report')
+    args = parser.parse_args(argv)
+
+    if not args.board and not args.sim:
+        parser.error('no boards, use --board or --sim')
+
+    config = Config(args.config)
+    scheduler = Scheduler()
+    wall = Wall(config, scheduler, _boards(args, config))
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    wall.run()
+    try:
+        if args.seconds:
+            time.sleep(args.seconds)
+            _print(wall.report())
+        else:
+            signal.pause()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        wall.stop()
+        scheduler.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## trace replay
+##
+###########
+"""replay a display trace against the pigpiod stand-in
+
+    python3 replay.py /tmp/retro.trace [config]
+
+    a trace comes from kill -USR1 on the clock or GET /trace,
+    see module tracer. each traced event is fed back through
+    a fresh Display on a pigsim board, with the clock showing
+    what it showed when the event was handled, and the state
+    and frame it left are checked against the trace. events
+    the handlers send themselves are in the trace already
+    and are not fed twice.
+
+    the replay runs on virtual time, see module clock: time
+    jumps to each event's stamp and the scheduler's jobs due
+    by then (repeats, fades) run first, so a replay is
+    deterministic and takes no longer than the CPU needs.
+
+    exits 1 if the replay diverged.
+"""
+
+import argparse
+import os
+import sys
+
+# run from the tree without PYTHONPATH
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'modules'))
+
+import tracer
+
+from clock import VirtualClock
+from config import Config
+from display import Display
+from event import Event
+from gra_afch import GraAfch
+from pigsim import Pi
+from scheduler import Scheduler
+from shadow_clock import ShadowClock
+
+VERSION = '0.0.1'
+
+class _TraceClock(ShadowClock):
+    """the RTC as it read when the traced event was handled
+    """
+
+    at = None
+
+    def now(self):
+        return self.at
+
+    def invalidate(self):
+        pass
+
+    def rebase(self, rtc_sec, mono_ns=None):
+        pass
+
+def replay(trace, config, verbose=False):
+    """feed the trace through a Display
+
+        return the number of events that diverged
+    """
+
+    records = trace['records']
+    if not records:
+        return 0
+
+    names = trace['events']
+    states = trace['states']
+    offset = trace['wall'] / 1e9 - trace['monotonic'] / 1e9
+
+    # virtual time on the trace's monotonic clock
+    vclock = VirtualClock(offset)
+    vclock.advance_to(records[0][0])
+
+    pi = Pi(hv5222=trace['hv5222'], clock=vclock, scripts=False)
+    event = Event()
+    scheduler = Scheduler(vclock)
+    gra_afch = GraAfch(config, event, scheduler, pi)
+    display = Display(gra_afch, event, scheduler)
+
+    # only traced events drive the display
+    display._sec_timer.cancel()
+    if display._blank_timer:
+        display._blank_timer.cancel()
+
+    clock = _TraceClock(gra_afch._ncs31x, config.rtc_resync, vclock)
+    gra_afch._clock = clock
+
+    first = records[0][0]
+    display._state = Display.STATES.index(states[records[0][2]])
+    display._is_blank = states[records[0][2]] == 'blank'
+
+    diverged = 0
+    for n, (stamp, type_, before, after, arg, frame) in enumerate(records):
+        vclock.advance_to(stamp)
+        scheduler.run_due()
+
+        clock.at = stamp / 1e9 + offset
+        display.state_machine(event.event(names[type_], arg))
+
+        # what the handlers and jobs sent is in the trace
+        while event.poll() is not None:
+            pass
+
+        state = Display.STATES[display._state]
+        shown = bytes(gra_afch._frame or bytes(8))
+        if state != states[after] or shown != frame:
+            diverged += 1
+            print('{:6d} {:10.3f}s {:12} {} -> {}, expected {} {}'.format(
+                n, (stamp - first) / 1e9, names[type_], state, shown.hex(),
+                states[after], frame.hex()))
+        elif verbose:
+            print('{:6d} {:10.3f}s {:12} {} {}'.format(
+                n, (stamp - first) / 1e9, names[type_], state, shown.hex()))
+
+    scheduler.stop()
+
+    return diverged
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='replay a retro display trace')
+    parser.add_argument('trace', help='trace dump')
+    parser.add_argument('config', nargs='?',
+                        default=os.path.join(os.path.dirname(__file__), '../etc/retro.json'))
+    parser.add_argument('--verbose', action='store_true',
+                        help='print every event, not just the divergent ones')
+    args = parser.parse_args(argv)
+
+    with open(args.trace, 'rb') as file:
+        trace = tracer.load(file)
+
+    diverged = replay(trace, Config(args.config), args.verbose)
+    print('{} events, {} diverged'.format(len(trace['records']), diverged))
+
+    sys.exit(1 if diverged else 0)
+
+if __name__ == '__main__':
+    main()
@@ -12,17 +12,29 @@
 ##
 ###########
 
-from threading import Timer
-
 import time
 import json
 import os
 import sys
 import signal
+import threading
+import traceback
+
+# run from the tree without PYTHONPATH, a bundle carries the
+# modules at its root
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'modules'))
+
+from datetime import datetime
 
+import startup
+
+from config import Config, Watcher
+from control import ControlServer
+from discipline import Discipline
 from gra_afch import GraAfch
 from event import Event
 from display import Display
+from scheduler import Scheduler
 
 class Retro:
     """retro class
@@ -33,33 +45,148 @@ class Retro:
     gra_afch = None
     event = None
     display = None
+    scheduler = None
+    runtime = None
+    up_since = None
+    config = None
+    discipline = None
 
-    _conf_dict = None
+    _watcher = None
+    _control = None
+    _dump = None
 
     def version(self):
         return self.VERSION
 
-    def __init__(self, conf_dict):
+    def status(self):
+        """web status, the asyncio runtime keeps a copy fresh
+        """
+
+        if self.runtime:
+            return self.runtime.status
+
+        return {
+            'version': self.version(),
+            'up_time': self.up_since.strftime('%m/%d/%Y %H:%M:%S'),
+            'display_time': self.display.time().strftime('%m/%d/%Y %H:%M:%S'),
+            'system_time': datetime.now().strftime('%m/%d/%Y %H:%M:%S'),
+        }
+
+    def configure(self):
+        """reread the configuration file and apply what changed
+        """
+
+        changed = self.config.reload()
+        if changed:
+            self.display.configure(changed)
+
+        return changed
+
+    def watch(self):
+        """reconfigure whenever the configuration file changes
+        """
+
+        self._watcher = Watcher(self.config.path, self.configure)
+
+    def control(self):
+        """serve the control socket, see module control
+        """
+
+        self._control = ControlServer(self, self.config.control_socket)
+
+    def dump_trace(self):
+        """write the display trace to the configured file, see module tracer
+        """
+
+        path = self.config.trace_file
+        with open(path + '.tmp', 'wb') as file:
+            file.write(self.display.trace())
+        os.replace(path + '.tmp', path)
+
+    def _dumper(self):
+        while True:
+            self._dump.wait()
+            self._dump.clear()
+            try:
+                self.dump_trace()
+            except Exception:
+                traceback.print_exc()
+
+    def start(self):
+        """light the tubes, start disciplining the RTC, and tell
+           systemd we're up
+        """
+
+        self.display.unblank_display()
+
+        # kill -USR1 dumps the trace. the handler runs on the
+        # event loop's thread, which may be holding the locks the
+        # dump needs, so it only raises a flag for the dumper
+        self._dump = threading.Event()
+        threading.Thread(target=self._dumper, name='trace-dump', daemon=True).start()
+        signal.signal(signal.SIGUSR1, lambda s, args: self._dump.set())
+
+        # keep the RTC on the system clock
+        if self.config.ntp and self.config.rtc_discipline:
+            self.discipline = Discipline(self.gra_afch._ncs31x,
+                                         self.gra_afch._clock,
+                                         self.config.rtc_discipline,
+                                         self.config.rtc_threshold,
+                                         self.config.rtc_aging)
+            self.discipline.start()
+
+        startup.notify(READY=1, STATUS='clock running')
+
+    def run(self):
+        """run the event loop, never returns
+        """
+
+        if self.runtime:
+            self.runtime.run(self)
+        else:
+            self.display.event_loop()
+
+    def __init__(self, config, gpio=None):
+        self.up_since = datetime.now()
+        self.config = config
         self.event = Event()
-        self.gra_afch = GraAfch(conf_dict, self.event)
-        self.display = Display(self.gra_afch, self.event)
 
-# main
-if __name__ == '__main__':
+        if config.runtime == 'asyncio':
+            from aio import AsyncRuntime
 
-    # this is for debugging
-    signal.signal(signal.SIGINT, lambda s, args : os._exit(0))
-    signal.signal(signal.SIGTERM, lambda s, args : os._exit(0))
+            self.runtime = AsyncRuntime()
+            self.scheduler = self.runtime.scheduler
+        else:
+            self.scheduler = Scheduler()
 
-    conf_dict = []
-    with open(os.path.join(os.path.dirname(__file__), '../etc/retro.json'), 'r') as file:
-        conf_dict = json.load(file)
+        self.gra_afch = GraAfch(config, self.event, self.scheduler, gpio)
+        self.display = Display(self.gra_afch, self.event, self.scheduler)
 
-    retro = Retro(conf_dict)
-    
-    # inhale deeply
-    time.sleep(4)
+def main(argv=None):
+    """run the clock, argv[1] is the config file
+    """
+
+    argv = sys.argv if argv is None else argv
+
+    # leave through the interpreter so the atexit handlers
+    # release the board, the daemon scripts and the socket
+    signal.signal(signal.SIGINT, lambda s, args : sys.exit(0))
+    signal.signal(signal.SIGTERM, lambda s, args : sys.exit(0))
+
+    path = argv[1] if len(argv) > 1 else \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etc', 'retro.json')
 
-    retro.display.unblank_display()
-    retro.display.event_loop()
-    
\ No newline at end of file
+    # the board has to answer before GraAfch and Display touch it
+    gpio = startup.connect()
+    if not startup.board(gpio):
+        print('the board is not answering, starting anyway')
+
+    retro = Retro(Config(path), gpio)
+    retro.watch()
+    retro.control()
+    retro.start()
+    retro.run()
+
+# main
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+##########
+##
+##  SPDX-License-Identifier: MIT
+##
+##  Copyright (c) 2017-2022 James M. Putnam <putnamjm.design@gmail.com>
+##
+##########
+
+##########
+##
+## soak test
+##
+###########
+"""soak the display on virtual time
+
+    python3 soak.py --days 365 --seed 7
+
+    runs the display stack against the simulated board on a
+    virtual clock, see module simulation, through every tick
+    of the days asked for, with random button storms, a
+    configuration change every simulated day and date mode
+    held across every midnight. after every event it checks:
+
+        the shadow clock keeps to the virtual wall clock, so
+        day, month and year rollovers come out right
+        a tick in time mode shows the time it was handled at,
+        and the last frame written is that time's frame
+        the frames date mode writes show the day, month and
+        year of the virtual time it wrote them at, then clear
+        a blank event leaves the display blanked
+
+    exits 1 on the first failed check, with the event that
+    failed it.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+from time import localtime, mktime, strftime, strptime
+
+# run from the tree without PYTHONPATH
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'modules'))
+
+from config import Config
+from ncs31x import Ncs31x
+from simulation import Simulation
+
+VERSION = '0.0.1'
+
+_PINS = (Ncs31x.UP_BUTTON_PIN, Ncs31x.DOWN_BUTTON_PIN, Ncs31x.MODE_BUTTON_PIN)
+
+# the handlers that show the date, (state, event)
+_DATE = (('time', 'mode-button'), ('date', 'tick'))
+
+# date mode handlers checked, and those that saw the date change
+_dates = {'checked': 0, 'rollovers': 0}
+
+# one of these a day, in turn
+_CHANGES = (
+    {'time-format': '24hour'},
+    {'zero-blank': True},
+    {'blank-timeout': 30},
+    {'dots': False},
+    {'minute-animation': 'slot-machine'},
+    {'time-format': '12hour', 'zero-blank': False},
+    {'blank-timeout': 0, 'minute-animation': 'crossfade'},
+    {'blank-timeout': 60, 'dots': True, 'minute-animation': 'none'},
+)
+
+def _digits(config, tm):
+    """the time digits tm should show
+    """
+
+    hour = tm.tm_hour - 12 if config.hour12 and tm.tm_hour > 12 else tm.tm_hour
+    digits = [hour // 10, hour % 10, tm.tm_min // 10, tm.tm_min % 10, tm.tm_sec // 10, tm.tm_sec % 10]
+    if config.zero_blank:
+        digits[0] = digits[0] or 0x20
+        digits[2] = digits[2] or 0x20
+
+    return digits
+
+def _date_digits(config, tm):
+    """the date digits tm should show
+    """
+
+    digits = [tm.tm_mday // 10, tm.tm_mday % 10, tm.tm_mon // 10, tm.tm_mon % 10,
+              (tm.tm_year - 2000) // 10, (tm.tm_year - 2000) % 10, 8, 8]
+    if config.zero_blank:
+        digits[0] = digits[0] or 0x20
+        digits[2] = digits[2] or 0x20
+
+    return digits
+
+def check(sim, ev, before, after):
+    """the soak invariants, see the module docstring
+    """
+
+    name = sim.event.name(ev.type)
+
+    skew = sim.gra_afch._clock.now() - sim.clock.time()
+    assert abs(skew) < 1.5, 'shadow clock {:+.3f}s off'.format(skew)
+
+    if name == 'tick' and before == after == 'time':
+        # the time was read somewhere in the handler: a resync
+        # waits for the RTC edge and a minute animation plays
+        # before it returns. ticks fall on the second, so allow
+        # for float error either side of it
+        digits = sim.digits()
+        now = sim.gra_afch._clock.now()
+        shown = [_digits(sim.config, localtime(second))
+                 for second in range(int(now - sim.busy - 1e-6), int(now + 1e-6) + 1)]
+        assert digits[:6] in shown, '{} shown as {}'.format(
+            strftime('%H:%M:%S', localtime(now)), digits)
+
+        frame = bytes(sim.gra_afch._encoder.encode(digits))
+        assert sim.frame() == frame, 'frame {} for {}'.format(sim.frame().hex(), digits)
+
+    if (before, name) in _DATE:
+        # the date is read once a second through the handler,
+        # which clears the tubes when it is done. the handler
+        # is seconds long, so the date may change inside it
+        now = sim.gra_afch._clock.now()
+        shown = [bytes(sim.gra_afch._encoder.encode(_date_digits(sim.config, localtime(at))))
+                 for at in (now - sim.busy, now)]
+        assert sim.written and sim.written[-1] == bytes(8), 'date mode left the tubes lit'
+        frames = sim.written[:-1]
+        assert frames, 'date mode wrote no date'
+        assert frames == shown[:len(frames)] or frames == shown[-len(frames):], \
+            'date frames {} for {}'.format([frame.hex() for frame in frames],
+                                           strftime('%Y-%m-%d %H:%M:%S', localtime(now)))
+        _dates['checked'] += 1
+        _dates['rollovers'] += len(frames) > 1
+
+    if name == 'blank':
+        assert sim.display._is_blank, 'blank left the display lit'
+
+def storm(sim, rng, presses):
+    """presses random presses over the next hour, some too short to see
+    """
+
+    for _ in range(presses):
+        sim.press(rng.choice(_PINS),
+                  rng.choice((0.001, 0.02, 0.1, 0.5, 1.5, 3.0)),
+                  rng.uniform(0, 3600))
+
+def date_mode(sim):
+    """put the display in date mode if it isn't, by the buttons
+    """
+
+    state = sim.state()
+    if state == 'blank':
+        # the first press only lights the tubes
+        sim.press(Ncs31x.MODE_BUTTON_PIN, 0.1)
+        sim.press(Ncs31x.MODE_BUTTON_PIN, 0.1, 0.5)
+    elif state == 'time':
+        sim.press(Ncs31x.MODE_BUTTON_PIN, 0.1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='retro soak test on virtual time')
+    parser.add_argument('config', nargs='?',
+                        default=os.path.join(os.path.dirname(__file__), '../etc/retro.json'))
+    parser.add_argument('--days', type=float, default=7,
+                        help='simulated days to run')
+    parser.add_argument('--start', default='2026-12-31',
+                        help='simulated start date, YYYY-MM-DD')
+    parser.add_argument('--presses', type=int, default=20,
+                        help='random button presses per simulated hour')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed, the same seed replays the same soak')
+    parser.add_argument('--hv5222', action='store_true',
+                        help='simulate an HV5222 board')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    config = Config(args.config)
+    sim = Simulation(config, mktime(strptime(args.start, '%Y-%m-%d')), args.hv5222)
+
+    start = time.perf_counter()
+    hours = round(args.days * 24)
+    try:
+        for hour in range(hours):
+            if hour % 24 == 0 and hour:
+                sim.configure(_CHANGES[(hour // 24 - 1) % len(_CHANGES)])
+            storm(sim, rng, args.presses)
+            if hour % 24 == 23:
+                # in date mode over midnight, the storm permitting.
+                # handlers run late, so aim by the wall clock
+                tm = sim.now()
+                sim.at((23 - tm.tm_hour) * 3600 + (59 - tm.tm_min) * 60 + 45 - tm.tm_sec,
+                       date_mode, sim)
+            sim.run(3600, check)
+    except AssertionError as ex:
+        print('{} {}: {}'.format(strftime('%Y-%m-%d %H:%M:%S', sim.now()), sim.state(), ex))
+        sys.exit(1)
+
+    elapsed = time.perf_counter() - start
+    print('{} simulated hours in {:.1f}s, {:.0f}x real time, {} events, ended {}'.format(
+        hours, elapsed, hours * 3600 / elapsed, sim.handled,
+        strftime('%Y-%m-%d %H:%M:%S', sim.now())))
+    print('{} date mode handlers checked, {} across a date change'.format(
+        _dates['checked'], _dates['rollovers']))
+    for (before, name, after), count in sorted(sim.transitions.items()):
+        print('    {:6} {:12} {:6} {:10d}'.format(before, name, after, count))
+
+if __name__ == '__main__':
+    main()